@@ -1,10 +1,21 @@
 import os
-from flask import Flask, jsonify, make_response, redirect, url_for
+from flask import Flask, make_response, redirect, url_for
 from flask_jwt_extended import JWTManager, get_jwt_identity, jwt_required, create_access_token, set_access_cookies, unset_access_cookies
 from flask_cors import CORS
 from api.config import ApplicationConfig
 from api.models import db, migrate
-from api.utils import stats
+from api.utils.stats import stats_snapshot
+from api.utils.routing import replica_router
+from api.utils.cache import alias_cache
+from api.utils.visits import visit_recorder
+from api.utils.rollups import rollups_cli
+from api.utils.avatars import avatars_cli
+from api.utils.documents import documents_cli
+from api.utils.analytics import analytics_cache
+from api.utils.acl import acl_cache
+from api.utils.identity import identity_cache, load_identity
+from api.utils.metrics import request_metrics, CONTENT_TYPE_LATEST
+from api.utils.serialization import jsonify, json_provider
 
 from api.routes.auth import auth
 from api.routes.user import user
@@ -13,7 +24,6 @@ from api.routes.document import document
 
 
 # TODO: If a url has not been visited in a long time (> 6months) and was not craeted by a registered user, Allow it to be reassigned
-# TODO: Share documents with specific people and allow them edit or just view (set permission)
 # TODO: Show who edited the document and time
 # TODO: csrf
 # TODO: Add table to monitor document edits and statistics
@@ -38,11 +48,35 @@ def create_app(test_config=None):
     jwt = JWTManager(app)
 
     db.init_app(app)
+    replica_router.init_app(app)
     migrate.init_app(app, db)
 
     with app.app_context():
         db.create_all()
 
+    alias_cache.configure(maxsize=app.config['ALIAS_CACHE_SIZE'], ttl=app.config['ALIAS_CACHE_TTL'])
+    analytics_cache.configure(maxsize=app.config['ANALYTICS_CACHE_SIZE'], ttl=app.config['ANALYTICS_CACHE_TTL'])
+    acl_cache.configure(maxsize=app.config['ACL_CACHE_SIZE'], ttl=app.config['ACL_CACHE_TTL'])
+    identity_cache.configure(maxsize=app.config['IDENTITY_CACHE_SIZE'], ttl=app.config['IDENTITY_CACHE_TTL'])
+    visit_recorder.init_app(app)
+    stats_snapshot.init_app(app)
+    request_metrics.init_app(app)
+    json_provider.init_app(app)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(avatars_cli)
+    app.cli.add_command(documents_cli)
+
+
+    @jwt.user_lookup_loader
+    def user_lookup_callback(jwt_header, jwt_payload):
+        return load_identity(jwt_payload['sub'])
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error_callback(jwt_header, jwt_payload):
+        # Valid token of a user that has since been deleted
+        response = make_response(jsonify({'error': 'invalid credentials'}), 401)
+        unset_access_cookies(response)
+        return response
 
     @jwt.unauthorized_loader
     def unauthorized_callback(callback):
@@ -85,19 +119,25 @@ def create_app(test_config=None):
 
     @app.route("/api/v1/stats")
     def get_general_stats():
-        url_pie = stats.url_pie
-        document_pie = stats.document_pie
-        stacked = stats.stacked
-        line = stats.line
+        snapshot = stats_snapshot.get()
 
         return jsonify({
-            'url_pie': url_pie,
-            'document_pie': document_pie,
-            'stacked': stacked,
-            'line': line
+            'url_pie': snapshot['url_pie'],
+            'document_pie': snapshot['document_pie'],
+            'stacked': snapshot['stacked'],
+            'line': snapshot['line'],
+            'generated_at': snapshot['generated_at']
         }), 200
 
 
+    @app.get('/metrics')
+    def metrics():
+        if not request_metrics.authorized():
+            return jsonify({'error': "not authorized"}), 401
+
+        return request_metrics.render(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+
+
     app.register_blueprint(auth)
     app.register_blueprint(user)
     app.register_blueprint(url)
@@ -4,6 +4,23 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def engine_options(uri):
+    # SQLite (used for local replica testing) runs without a sized pool
+    if uri.startswith('sqlite'):
+        return {}
+
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+    }
+
+def replica_binds():
+    urls = [url.strip() for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if url.strip()]
+    return { f'replica_{index}': url for index, url in enumerate(urls) }
+
 class ApplicationConfig:
 
     JWT_SECRET_KEY = os.environ["JWT_SECRET_KEY"]
@@ -16,5 +33,37 @@ class ApplicationConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False
     SQLALCHEMY_DATABASE_URI = os.environ["GCP_DATABASE_URL"]
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = replica_binds()
+    REPLICA_MAX_LAG_BYTES = int(os.environ.get('REPLICA_MAX_LAG_BYTES', 16 * 1024 * 1024))
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 10))
+    REPLICA_AFTER_WRITE = int(os.environ.get('REPLICA_AFTER_WRITE', 30))
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024
-    FRONTEND=os.environ['FRONTEND']
\ No newline at end of file
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson')
+    FRONTEND=os.environ['FRONTEND']
+    ALIAS_CACHE_SIZE = int(os.environ.get('ALIAS_CACHE_SIZE', 10000))
+    ALIAS_CACHE_TTL = int(os.environ.get('ALIAS_CACHE_TTL', 300))
+    ALIAS_CACHE_NEGATIVE_TTL = int(os.environ.get('ALIAS_CACHE_NEGATIVE_TTL', 30))
+    VISIT_RECORDING_MODE = os.environ.get('VISIT_RECORDING_MODE', 'async')
+    VISIT_BATCH_SIZE = int(os.environ.get('VISIT_BATCH_SIZE', 500))
+    VISIT_FLUSH_INTERVAL_MS = int(os.environ.get('VISIT_FLUSH_INTERVAL_MS', 500))
+    VISIT_ENQUEUE_TIMEOUT_MS = int(os.environ.get('VISIT_ENQUEUE_TIMEOUT_MS', 50))
+    VISIT_QUEUE_SIZE = int(os.environ.get('VISIT_QUEUE_SIZE', 10000))
+    AVATAR_WORKERS = int(os.environ.get('AVATAR_WORKERS', 2))
+    AVATAR_PROCESS_TIMEOUT = int(os.environ.get('AVATAR_PROCESS_TIMEOUT', 30))
+    ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', 10000))
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+    ACL_CACHE_SIZE = int(os.environ.get('ACL_CACHE_SIZE', 10000))
+    ACL_CACHE_TTL = int(os.environ.get('ACL_CACHE_TTL', 300))
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 2))
+    PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', 8))
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    STATS_REFRESH_INTERVAL = int(os.environ.get('STATS_REFRESH_INTERVAL', 300))
+    REDIRECT_STATUS = int(os.environ.get('REDIRECT_STATUS', 302))
+    REDIRECT_MAX_AGE = int(os.environ.get('REDIRECT_MAX_AGE', 0))
+    METRICS_QUERY_HEADER = os.environ.get('METRICS_QUERY_HEADER', 'False') == 'True'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
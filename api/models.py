@@ -1,23 +1,79 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+import zlib
+from sqlalchemy.orm import validates
 from datetime import datetime
 from uuid import uuid4
+from hashlib import sha256
+from api.utils.routing import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 
 def get_uuid():
     return uuid4().hex
 
+def hash_long_url(long_url):
+    return sha256(long_url.encode('utf-8')).hexdigest()
+
+SNIPPET_LENGTH = 200
+
+
+class CompressedText(db.TypeDecorator):
+    # Text stored as bytea behind a one byte header. Values of at least
+    # `threshold` bytes are zlib-compressed when that actually saves space.
+    impl = db.LargeBinary
+    cache_ok = True
+
+    RAW = b'\x00'
+    ZLIB = b'\x01'
+
+    def __init__(self, threshold=1024, level=1, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.level = level
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        data = value.encode('utf-8')
+        if len(data) >= self.threshold:
+            compressed = zlib.compress(data, self.level)
+            if len(compressed) < len(data):
+                return self.ZLIB + compressed
+        return self.RAW + data
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        value = bytes(value)
+        header, data = value[:1], value[1:]
+        if header == self.ZLIB:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
 
 user_urls = db.Table('user_urls',
     db.Column('user_id', db.String(32), db.ForeignKey('users.id')),
     db.Column('url_id', db.String(32), db.ForeignKey('urls.id')),
+    # When the user got the url, which orders their url listing
+    db.Column('created_at', db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.text("timezone('utc', now())")),
+    db.Index('ix_user_urls_user_id_url_id', 'user_id', 'url_id', unique=True),
+    db.Index('ix_user_urls_url_id', 'url_id'),
+    db.Index('ix_user_urls_user_id_created_at_url_id', 'user_id', 'created_at', 'url_id'),
 )
 
+# Advances a block at a time, see api/utils/shortcode.py
+short_code_sequence = db.Sequence('short_code_seq', start=1, increment=1000, metadata=db.metadata)
+
 document_shared_users = db.Table('document_shared_users',
     db.Column('user_id', db.String(32), db.ForeignKey('users.id')),
     db.Column('document_id', db.String(32), db.ForeignKey('documents.id')),
+    # 'view' or 'edit', see api/utils/acl.py
+    db.Column('permission', db.String(10), nullable=False, default='edit', server_default='edit'),
+    db.Index('ix_document_shared_users_document_id_user_id', 'document_id', 'user_id', unique=True),
+    db.Index('ix_document_shared_users_user_id', 'user_id'),
 )
 
 class User(db.Model):
@@ -41,9 +97,18 @@ class Url(db.Model):
     id = db.Column(db.String(32), primary_key=True, unique=True, default=get_uuid)
     short_url = db.Column(db.String(30), unique=True)
     long_url = db.Column(db.Text())
+    long_url_hash = db.Column(db.String(64))
     is_private = db.Column(db.Boolean(), default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     visits = db.relationship('Visit', backref='url', lazy='select')
+    __table_args__ = (
+        db.Index('ix_urls_long_url_hash_public', 'long_url_hash', postgresql_where=db.text('is_private = false')),
+    )
+
+    @validates('long_url')
+    def set_long_url_hash(self, key, long_url):
+        self.long_url_hash = hash_long_url(long_url) if long_url is not None else None
+        return long_url
 
     def __repr__(self):
         return self.short_url + ' - ' + self.long_url + ' -> ' + self.id
@@ -54,13 +119,29 @@ class Document(db.Model):
     id = db.Column(db.String(32), primary_key=True, unique=True, default=get_uuid)
     title = db.Column(db.String(50), nullable=False)
     user_id = db.Column(db.String(32), db.ForeignKey('users.id'), nullable=False)
-    html_text = db.Column(db.Text(), nullable=False)
-    plain_text = db.Column(db.Text(), nullable=False)
+    # Deferred, so bodies are only fetched and decompressed when accessed
+    html_text = db.deferred(db.Column(CompressedText(), nullable=False))
+    plain_text = db.deferred(db.Column(CompressedText(), nullable=False))
+    snippet = db.Column(db.String(SNIPPET_LENGTH))
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on sharing changes to retire cached access decisions
+    acl_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     is_private = db.Column(db.Boolean(), default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     visits = db.relationship('Visit', backref='document', lazy='select')
     users_sharing = db.relationship('User', secondary=document_shared_users, backref='shared_documents', lazy='select')
+    __table_args__ = (
+        db.Index('ix_documents_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+    # Every UPDATE checks the revision, so concurrent saves conflict. Only
+    # edit_document advances it, next to the history row it records.
+    __mapper_args__ = { 'version_id_col': revision, 'version_id_generator': False }
+
+    @validates('plain_text')
+    def set_snippet(self, key, plain_text):
+        self.snippet = plain_text[:SNIPPET_LENGTH] if plain_text is not None else None
+        return plain_text
 
     def __repr__(self):
         return self.title + ' -> ' + self.id
@@ -71,4 +152,74 @@ class Visit(db.Model):
     id = db.Column(db.String(32), primary_key=True, unique=True, default=get_uuid)
     url_id = db.Column(db.String(32), db.ForeignKey('urls.id'))
     document_id = db.Column(db.String(32), db.ForeignKey('documents.id'))
-    time = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    time = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_visits_url_id_time', 'url_id', 'time'),
+        db.Index('ix_visits_document_id_time', 'document_id', 'time'),
+    )
+
+class DailyVisitRollup(db.Model):
+    __tablename__ = "visit_rollups_daily"
+    id = db.Column(db.Integer, primary_key=True)
+    url_id = db.Column(db.String(32), db.ForeignKey('urls.id', ondelete='CASCADE'))
+    document_id = db.Column(db.String(32), db.ForeignKey('documents.id', ondelete='CASCADE'))
+    bucket = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('uq_visit_rollups_daily_url', 'url_id', 'bucket', unique=True, postgresql_where=url_id.isnot(None)),
+        db.Index('uq_visit_rollups_daily_document', 'document_id', 'bucket', unique=True, postgresql_where=document_id.isnot(None)),
+    )
+
+class GlobalStats(db.Model):
+    __tablename__ = "global_stats"
+    # A single row, the /api/v1/stats payload shared by every worker
+    id = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.JSON, nullable=False)
+    generated_at = db.Column(db.DateTime, nullable=False)
+
+
+
+class DocumentRevision(db.Model):
+    __tablename__ = "document_revisions"
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.String(32), db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    editor_id = db.Column(db.String(32), db.ForeignKey('users.id', ondelete='SET NULL'))
+    title = db.Column(db.String(50), nullable=False)
+    # The row of the document's current revision has NULL bodies, standing for
+    # the document's own. Older ones hold a reverse delta to the next revision,
+    # or the full body when is_snapshot is set.
+    is_snapshot = db.Column(db.Boolean(), nullable=False, default=False)
+    html_text = db.deferred(db.Column(CompressedText()))
+    plain_text = db.deferred(db.Column(CompressedText()))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    editor = db.relationship('User', lazy='select')
+    __table_args__ = (
+        db.Index('uq_document_revisions_document_id_revision', 'document_id', 'revision', unique=True),
+    )
+
+
+
+class SearchTerm(db.Model):
+    __tablename__ = "search_terms"
+    term = db.Column(db.String(64), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_search_terms_term_pattern', 'term', postgresql_ops={ 'term': 'varchar_pattern_ops' }),
+    )
+
+
+class SearchPosting(db.Model):
+    __tablename__ = "search_postings"
+    term = db.Column(db.String(64), primary_key=True)
+    document_id = db.Column(db.String(32), db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    frequency = db.Column(db.Integer, nullable=False)
+    __table_args__ = (
+        db.Index('ix_search_postings_document_id', 'document_id'),
+    )
+
+
+class SearchDocument(db.Model):
+    __tablename__ = "search_documents"
+    document_id = db.Column(db.String(32), db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    length = db.Column(db.Integer, nullable=False)
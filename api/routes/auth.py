@@ -1,11 +1,11 @@
-import os
-import base64
-from flask import Blueprint, jsonify, request, make_response
+from flask import Blueprint, request, make_response
 from flask_cors import cross_origin
-from flask_jwt_extended import create_access_token, get_jwt_identity, create_refresh_token, set_access_cookies, set_refresh_cookies, unset_jwt_cookies, jwt_required
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import create_access_token, create_refresh_token, set_access_cookies, set_refresh_cookies, unset_jwt_cookies, jwt_required, current_user
 from api.models import db, User
 from api.utils.helpers import validate_password, validate_name, validate_email
+from api.utils.avatars import avatar_url
+from api.utils.passwords import hash_password, verify_password, needs_rehash, PasswordQueueFull
+from api.utils.serialization import jsonify
 
 
 auth = Blueprint("auth", __name__, url_prefix="/api/v1/auth")
@@ -22,32 +22,52 @@ def login():
 
         user = User.query.filter_by(email=email).first()
 
-        if not (user and check_password_hash(user.password, password)):
+        if not user:
             return jsonify({'error': 'invalid credentials'}), 401
 
+        user_id = user.id
+        password_hash = user.password
         first_name = user.first_name
         last_name = user.last_name
         email = user.email
-        avatar = user.avatar
-        if avatar:
-            with open(os.path.join('data/imgs', avatar), 'rb') as binary_file:
-                binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
-                base64_avatar = base64_encoded_data.decode('utf-8')
-        else:
-            base64_avatar = ''
-
-        access = create_access_token(identity=user.id)
-        refresh = create_refresh_token(identity=user.id)
+        avatar = avatar_url(user.avatar)
+
+        # Don't hold a connection while the hash is checked
+        db.session.close()
+
+        if not verify_password(password_hash, password):
+            return jsonify({'error': 'invalid credentials'}), 401
+
+        # Upgrade hashes made with an older method or work factor, unless the
+        # password changed in the meantime. It can wait for a later login
+        # when the pool is busy.
+        if needs_rehash(password_hash):
+            try:
+                User.query.filter_by(id=user_id, password=password_hash)\
+                    .update({ 'password': hash_password(password) }, synchronize_session=False)
+                db.session.commit()
+            except PasswordQueueFull:
+                pass
+
+        access = create_access_token(identity=user_id)
+        refresh = create_refresh_token(identity=user_id)
+
+    except PasswordQueueFull:
+        db.session.rollback()
+        return busy_response()
 
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+    finally:
+        db.session.close()
+
     response = make_response(jsonify({
         "first_name": first_name,
         "last_name": last_name,
         "email": email,
-        "avatar": base64_avatar
+        "avatar_url": avatar
     }), 200)
 
     set_access_cookies(response, access)
@@ -79,11 +99,15 @@ def register_user():
         if user_exists:
             return jsonify({"error": "user already exists"}), 409
 
-        new_user = User(first_name=first_name, last_name=last_name, email=email, password=generate_password_hash(password))
+        new_user = User(first_name=first_name, last_name=last_name, email=email, password=hash_password(password))
         db.session.add(new_user)
         db.session.commit()
         user_id = new_user.id
 
+    except PasswordQueueFull:
+        db.session.rollback()
+        return busy_response()
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -100,6 +124,14 @@ def register_user():
 
 
 
+def busy_response():
+    # Too many password hashes in flight on this worker
+    response = make_response(jsonify({'error': 'server busy, try again shortly'}), 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+
 @auth.get("/logout")
 def logout():
     response = make_response(jsonify({'message': 'logged out'}), 200)
@@ -112,21 +144,11 @@ def logout():
 @auth.get('/validate')
 @jwt_required()
 def validate():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     try:
-        first_name = user.first_name
-        last_name = user.last_name
-        email = user.email
-        avatar = user.avatar
-        if avatar:
-            with open(os.path.join('data/imgs', avatar), 'rb') as binary_file:
-                binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
-                base64_avatar = base64_encoded_data.decode('utf-8')
-        else:
-            base64_avatar = ''
+        first_name = current_user.first_name
+        last_name = current_user.last_name
+        email = current_user.email
+        avatar = avatar_url(current_user.avatar)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -135,6 +157,6 @@ def validate():
         "first_name": first_name,
         "last_name": last_name,
         "email": email,
-        "avatar": base64_avatar,
+        "avatar_url": avatar,
         "success": True
     }), 200
@@ -1,7 +1,20 @@
 from pydoc import doc
-from flask import Blueprint, jsonify, request
+from hashlib import blake2b
+from flask import Blueprint, request, make_response
+from werkzeug.http import is_resource_modified
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.models import db, User, Visit, Document
+from sqlalchemy.orm import undefer
+from sqlalchemy.orm.exc import StaleDataError
+from api.models import db, User, Document, DocumentRevision, document_shared_users
+from api.utils.visits import visit_recorder
+from api.utils.patches import apply_patches, PatchError
+from api.utils.helpers import parse_page_size
+from api.utils.revisions import start_history, record_revision, reconstruct, unified_diff
+from api.utils.search import index_document, unindex_document, search_documents
+from api.utils.analytics import invalidate_user_analytics
+from api.utils.membership import share_document, unshare_document
+from api.utils.acl import can_view, can_edit, document_role, bump_acl_version, OWNER, EDITOR, EDIT, PERMISSIONS
+from api.utils.serialization import jsonify
 
 
 document = Blueprint("document", __name__, url_prefix="/api/v1/document")
@@ -12,27 +25,29 @@ document = Blueprint("document", __name__, url_prefix="/api/v1/document")
 def get_document(document_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
+        # Bodies are deferred, so this only reads the metadata columns
         document = Document.query.get(document_id)
 
         if not document:
             return jsonify({"error": "document not found"}), 404
 
-        if document.is_private:
-            if user not in document.users_sharing:
-                jsonify({"error": "restricted access"}), 403
-
-        visit = Visit()
-        document.visits.append(visit)
-        db.session.add(visit)
-        db.session.commit()
+        if not can_view(user_id, document):
+            return jsonify({"error": "restricted access"}), 403
 
         id = document.id
-        title = document.title
-        html_text = document.html_text
         users_sharing = [current_user.email for current_user in document.users_sharing]
-        private = document.is_private
+        etag = document_etag(document, users_sharing)
+        last_modified = document.updated_at or document.created_at
+        modified = is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+        if modified:
+            title = document.title
+            html_text = document.html_text
+            private = document.is_private
+            revision = document.revision
+
+        visit_recorder.record(document_id=id)
 
     except Exception as e:
         db.session.rollback()
@@ -40,15 +55,59 @@ def get_document(document_id):
 
     finally:
         db.session.close()
-        
-    return jsonify({
-        "id": id,
-        "title": title,
-        "html_text": html_text,
-        "users_sharing": users_sharing,
-        "private": private
-    }), 200
-        
+
+    if modified:
+        response = make_response(jsonify({
+            "id": id,
+            "title": title,
+            "html_text": html_text,
+            "users_sharing": users_sharing,
+            "private": private,
+            "revision": revision
+        }), 200)
+    else:
+        response = make_response('', 304)
+
+    # Sharing changes don't touch updated_at, so clients should rely on the ETag
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+
+@document.get("/search")
+@jwt_required()
+def search():
+    try:
+        user_id = get_jwt_identity()
+
+        query = request.args.get("q", default="", type=str)
+        scope = request.args.get("scope", default=None, type=str)
+        limit = parse_page_size(request.args.get("limit", default=None, type=int))
+
+        if not query.strip():
+            return jsonify({"error": "missing search query"}), 400
+
+        if scope not in (None, "owned", "shared"):
+            return jsonify({"error": "scope should be owned or shared"}), 400
+
+        results = [{
+                    "id": result.id,
+                    "title": result.title,
+                    "snippet": result.snippet,
+                    "score": round(float(result.score), 4)
+                } for result in search_documents(user_id, query, limit, scope)]
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    finally:
+        db.session.close()
+
+    return jsonify({ 'results': results }), 200
+
 
 
 @document.post("/create")
@@ -56,7 +115,6 @@ def get_document(document_id):
 def create_document():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
         title = request.json.get("title", None)
         html_text = request.json.get("html_text", None)
@@ -66,10 +124,14 @@ def create_document():
         if not (title and html_text and plain_text):
             return jsonify({"error": "missing or invalid title or content"}), 400
 
-        document = Document(title=title, html_text=html_text, plain_text=plain_text, is_private=is_private, user=user)
+        document = Document(title=title, html_text=html_text, plain_text=plain_text, is_private=is_private, user_id=user_id)
         db.session.add(document)
-        db.session.commit()
+        db.session.flush()
+        start_history(document, user_id)
+        index_document(document.id, title, plain_text)
         doc_id = document.id
+        db.session.commit()
+        invalidate_user_analytics(user_id)
 
     except Exception as e:
         db.session.rollback()
@@ -87,34 +149,74 @@ def create_document():
 def edit_document():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
         document_id = request.json.get("id", None)
         title = request.json.get("title", None)
         html_text = request.json.get("html_text", None)
         plain_text = request.json.get("plain_text", None)
+        patches = request.json.get("patches", None)
+        base_revision = request.json.get("base_revision", None)
         is_private = request.json.get("is_private", None)
 
         if not document_id:
             return jsonify({"error": "document not found"}), 404
 
-        document = Document.query.get(document_id)
+        if patches is not None and base_revision is None:
+            return jsonify({"error": "patches need a base_revision"}), 400
+
+        if base_revision is not None and type(base_revision) != int:
+            return jsonify({"error": "base_revision should be an integer"}), 400
+
+        document = Document.query.options(undefer(Document.html_text), undefer(Document.plain_text)).get(document_id)
+
+        if not can_edit(user_id, document):
+            return jsonify({"error": "restricted access"}), 403
 
-        if document.is_private:
-            if user != document.user and (user not in document.users_sharing):
-                jsonify({"error": "restricted access"}), 403
+        # Only the owner decides who can see the document at all
+        if is_private is not None and is_private != document.is_private and user_id != document.user_id:
+            return jsonify({"error": "only the owner can change privacy"}), 403
 
+        if base_revision is not None and base_revision != document.revision:
+            return jsonify({"error": "revision conflict", "revision": document.revision}), 409
+
+        previous = (document.revision, document.title, document.html_text, document.plain_text, document.updated_at or document.created_at)
 
         if title:
             document.title = title
-        if html_text and plain_text:
+        if patches is not None:
+            # Offsets come from the editor's JavaScript strings, in UTF-16 code
+            # units. A patch may empty the document, unlike a full body.
+            try:
+                document.html_text = apply_patches(document.html_text, patches.get("html_text", []), utf16=True)
+                document.plain_text = apply_patches(document.plain_text, patches.get("plain_text", []), utf16=True)
+            except (PatchError, AttributeError):
+                return jsonify({"error": "invalid patches"}), 400
+        elif html_text and plain_text:
             document.html_text = html_text
             document.plain_text = plain_text
         if is_private is not None:
             document.is_private = is_private
-
+        if db.session.is_modified(document):
+            document.revision = previous[0] + 1
+
+        db.session.flush()
+        revision = document.revision
+        if revision != previous[0]:
+            record_revision(document, previous, user_id)
+        if (document.title, document.plain_text) != (previous[1], previous[3]):
+            index_document(document.id, document.title, document.plain_text)
+        owner_id = document.user_id
+        title_changed = document.title != previous[1]
         db.session.commit()
 
+        # Titles label the document pie
+        if title_changed:
+            invalidate_user_analytics(owner_id)
+
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"error": "revision conflict"}), 409
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -122,7 +224,145 @@ def edit_document():
     finally:
         db.session.close()
 
-    return jsonify({ 'message': "success" }), 201
+    return jsonify({ 'message': "success", 'revision': revision }), 201
+
+
+
+def document_etag(document, users_sharing):
+    # The revision covers title, body and privacy; sharing is hashed in because
+    # it is part of the payload but doesn't bump the revision
+    sharing = blake2b('\n'.join(sorted(users_sharing)).encode('utf-8'), digest_size=8).hexdigest()
+    return f"{document.id}-{document.revision}-{sharing}"
+
+
+
+@document.get("/id/<document_id>/revisions")
+@jwt_required()
+def get_document_revisions(document_id):
+    try:
+        user_id = get_jwt_identity()
+
+        limit = parse_page_size(request.args.get("limit", default=None, type=int))
+        before = request.args.get("before", default=None, type=int)
+
+        document = Document.query.get(document_id)
+
+        if not document:
+            return jsonify({"error": "document not found"}), 404
+
+        if not can_view(user_id, document):
+            return jsonify({"error": "restricted access"}), 403
+
+        query = DocumentRevision.query\
+                .filter(DocumentRevision.document_id == document_id)\
+                .order_by(DocumentRevision.revision.desc())
+        if before is not None:
+            query = query.filter(DocumentRevision.revision < before)
+
+        revisions = [{
+                        "revision": revision.revision,
+                        "title": revision.title,
+                        "editor": revision.editor.email if revision.editor else None,
+                        "created_at": revision.created_at
+                    } for revision in query.limit(limit).all()]
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    finally:
+        db.session.close()
+
+    return jsonify({ 'revisions': revisions }), 200
+
+
+
+@document.get("/id/<document_id>/revisions/<int:revision>")
+@jwt_required()
+def get_document_revision(document_id, revision):
+    try:
+        user_id = get_jwt_identity()
+
+        document = Document.query.options(undefer(Document.html_text), undefer(Document.plain_text)).get(document_id)
+
+        if not document:
+            return jsonify({"error": "document not found"}), 404
+
+        if not can_view(user_id, document):
+            return jsonify({"error": "restricted access"}), 403
+
+        reconstructed = reconstruct(document, revision)
+
+        if not reconstructed:
+            return jsonify({"error": "revision not found"}), 404
+
+        row, html_text, plain_text = reconstructed
+        if row:
+            title = row.title
+            editor = row.editor.email if row.editor else None
+            created_at = row.created_at
+        else:
+            title = document.title
+            editor = None
+            created_at = document.updated_at or document.created_at
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    finally:
+        db.session.close()
+
+    return jsonify({
+        "id": document_id,
+        "revision": revision,
+        "title": title,
+        "html_text": html_text,
+        "plain_text": plain_text,
+        "editor": editor,
+        "created_at": created_at
+    }), 200
+
+
+
+@document.get("/id/<document_id>/revisions/<int:revision>/diff")
+@jwt_required()
+def diff_document_revision(document_id, revision):
+    try:
+        user_id = get_jwt_identity()
+
+        document = Document.query.options(undefer(Document.html_text), undefer(Document.plain_text)).get(document_id)
+
+        if not document:
+            return jsonify({"error": "document not found"}), 404
+
+        if not can_view(user_id, document):
+            return jsonify({"error": "restricted access"}), 403
+
+        against = request.args.get("against", default=document.revision, type=int)
+
+        old = reconstruct(document, revision)
+        new = reconstruct(document, against)
+
+        if not (old and new):
+            return jsonify({"error": "revision not found"}), 404
+
+        old_label = f"revision {revision}"
+        new_label = f"revision {against}"
+        html_diff = unified_diff(old[1], new[1], old_label, new_label)
+        plain_diff = unified_diff(old[2], new[2], old_label, new_label)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+    finally:
+        db.session.close()
+
+    return jsonify({
+        "id": document_id,
+        "revision": revision,
+        "against": against,
+        "html_text": html_diff,
+        "plain_text": plain_diff
+    }), 200
 
 
 
@@ -131,36 +371,42 @@ def edit_document():
 def edit_document_sharing():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
         user_email = request.json.get("user_email", None)
         add_user = request.json.get("add_user", None)
         document_id = request.json.get("id", None)
+        permission = request.json.get("permission", EDIT)
 
         if (add_user is None) or (user_email is None) or (document_id is None):
             return jsonify({"error": "incomplete edit information"}), 400
 
+        if permission not in PERMISSIONS:
+            return jsonify({"error": "permission should be view or edit"}), 400
+
         document = Document.query.get(document_id)
 
-        if document.is_private:
-            if user != document.user and (user not in document.users_sharing):
-                return jsonify({"error": "restricted access"}), 403
+        if document_role(user_id, document) not in (OWNER, EDITOR):
+            return jsonify({"error": "restricted access"}), 403
+
+        target_id = db.session.query(User.id).filter_by(email=user_email).scalar()
 
         if not add_user:
-            user_to_remove = User.query.filter_by(email=user_email).first()
-            if user_to_remove in document.users_sharing:
-                document.users_sharing.remove(user_to_remove)
+            if target_id:
+                unshare_document(document.id, target_id)
         else:
-            user_to_add = User.query.filter_by(email=user_email).first()
-
-            if not user_to_add:
+            if not target_id:
                 return jsonify({"error": "no user with given email"}), 404
 
-            if user_to_add not in document.users_sharing:
-                document.users_sharing.append(user_to_add)
+            share_document(document.id, target_id, permission)
 
+        bump_acl_version(document.id)
         db.session.commit()
-        users_sharing = [current_user.email for current_user in document.users_sharing]
+        shares = db.session.query(User.email, document_shared_users.c.permission)\
+                    .join(document_shared_users, document_shared_users.c.user_id == User.id)\
+                    .filter(document_shared_users.c.document_id == document_id)\
+                    .all()
+        users_sharing = [email for email, _ in shares]
+        permissions = dict(shares)
 
     except Exception as e:
         db.session.rollback()
@@ -169,7 +415,7 @@ def edit_document_sharing():
     finally:
         db.session.close()
 
-    return jsonify({ 'users_sharing': users_sharing }), 201
+    return jsonify({ 'users_sharing': users_sharing, 'permissions': permissions }), 201
 
 
 
@@ -178,14 +424,15 @@ def edit_document_sharing():
 def delete_document(document_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
         document = Document.query.get(document_id)
 
-        if document.user == user:
+        if document.user_id == user_id:
+            unindex_document(document.id)
             db.session.delete(document)
 
         db.session.commit()
+        invalidate_user_analytics(user_id)
 
     except Exception as e:
         db.session.rollback()
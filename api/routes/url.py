@@ -1,7 +1,13 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from api.models import db, User, Url, Visit
-from api.utils.helpers import sanitize_long_url, sanitize_short_url, generate_short_url, validate_make_private
+from api.models import db, Url, hash_long_url
+from api.utils.helpers import sanitize_long_url, sanitize_short_url, generate_short_url, commit_with_short_url, validate_make_private, resolve_short_url
+from api.utils.cache import alias_cache
+from api.utils.visits import visit_recorder
+from api.utils.analytics import invalidate_user_analytics
+from api.utils.membership import add_url_owner, remove_url_owner
+from api.utils.metrics import request_metrics
+from api.utils.serialization import jsonify
 
 
 url = Blueprint("url", __name__, url_prefix="/api/v1/url")
@@ -18,16 +24,13 @@ def get_url():
         if not short_url:
             return jsonify({"error": "no url provided"}), 400
 
-        url = Url.query.filter_by(short_url=short_url).first()
+        resolved = resolve_short_url(short_url)
 
-        if not url:
+        if not resolved:
             return jsonify({"error": "url does not exist"}), 404
 
-        long_url = url.long_url
-        visit = Visit()
-        url.visits.append(visit)
-        db.session.add(visit)
-        db.session.commit()
+        url_id, long_url, _ = resolved
+        visit_recorder.record(url_id=url_id)
 
     except Exception as e:
         db.session.rollback()
@@ -52,15 +55,14 @@ def create_url():
         if not long_url:
             return jsonify({"error": "missing or invalid url"}), 400
 
-        url = Url.query.filter_by(long_url=long_url, is_private=False).first()
+        url = Url.query.filter_by(long_url_hash=hash_long_url(long_url), long_url=long_url, is_private=False).first()
 
         if url:
             short_url = url.short_url
         else:
-            short_url = generate_short_url(long_url)
-            new_url = Url(long_url=long_url, short_url=short_url)
-            db.session.add(new_url)
-            db.session.commit()
+            new_url = Url(long_url=long_url, short_url=generate_short_url(long_url))
+            short_url = commit_with_short_url(new_url)
+            alias_cache.delete(short_url)
 
     except Exception as e:
         db.session.rollback()
@@ -90,20 +92,19 @@ def create_my_url():
             return jsonify({"error": "make_private should be boolean"}), 400
 
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
-        url = Url.query.filter_by(long_url=long_url, is_private=False).first()
+        url = Url.query.filter_by(long_url_hash=hash_long_url(long_url), long_url=long_url, is_private=False).first()
 
         if url and not make_private:
             short_url = url.short_url
-            if user not in url.users:
-                url.users.append(user)
+            if add_url_owner(user_id, url.id):
                 db.session.commit()
+                invalidate_user_analytics(user_id)
         else:
-            short_url = generate_short_url(long_url)
-            new_url = Url(long_url=long_url, short_url=short_url, is_private=make_private, users=[user])
-            db.session.add(new_url)
-            db.session.commit()
+            new_url = Url(long_url=long_url, short_url=generate_short_url(long_url), is_private=make_private)
+            short_url = commit_with_short_url(new_url, owner_id=user_id)
+            alias_cache.delete(short_url)
+            invalidate_user_analytics(user_id)
 
     except Exception as e:
         db.session.rollback()
@@ -135,15 +136,18 @@ def create_my_url_alias():
             return jsonify({"error": "missing or invalid url(s)"}), 400
 
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         url = Url.query.filter_by(short_url=my_short_url).first()
 
         if url:
             return jsonify({'error': "url alias already taken"}), 409
 
-        new_url = Url(long_url=long_url, short_url=my_short_url, is_private=True, users=[user])
+        new_url = Url(long_url=long_url, short_url=my_short_url, is_private=True)
         db.session.add(new_url)
+        db.session.flush()
+        add_url_owner(user_id, new_url.id)
         db.session.commit()
+        alias_cache.delete(my_short_url)
+        invalidate_user_analytics(user_id)
 
     except Exception as e:
         db.session.rollback()
@@ -162,14 +166,16 @@ def create_my_url_alias():
 def delete_url(url_id):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
         url = Url.query.get(url_id)
 
-        if user in url.users:
-            url.users.remove(user)
+        short_url = url.short_url
+
+        remove_url_owner(user_id, url.id)
 
         db.session.commit()
+        alias_cache.delete(short_url)
+        invalidate_user_analytics(user_id)
 
     except Exception as e:
         db.session.rollback()
@@ -178,4 +184,13 @@ def delete_url(url_id):
     finally:
         db.session.close()
 
-    return jsonify({ 'url_id': url_id }), 200
\ No newline at end of file
+    return jsonify({ 'url_id': url_id }), 200
+
+
+
+@url.get("/cache/stats")
+def get_cache_stats():
+    if not request_metrics.authorized():
+        return jsonify({'error': "not authorized"}), 401
+
+    return jsonify(alias_cache.stats()), 200
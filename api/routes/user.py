@@ -1,13 +1,17 @@
 import os
-import base64
-from datetime import datetime, timedelta
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask import Blueprint, request, send_file
+from flask_jwt_extended import get_jwt_identity, jwt_required, current_user
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func, desc, asc
-from api.models import db, User, Url, Visit, Document
-from api.utils.helpers import get_file_extension, validate_password, validate_name, validate_email, number_to_month
+from sqlalchemy import desc, tuple_
+from api.models import db, User, Url, Document, user_urls as url_owners
+from api.utils.helpers import validate_password, validate_name, validate_email, parse_page_size, encode_cursor, decode_cursor
+from api.utils.avatars import SIZES, DEFAULT_SIZE, avatar_url, stored_avatar, save_avatar, remove_avatar, InvalidImage
+from api.utils.analytics import user_analytics
+from api.utils.routing import read_only
+from api.utils.identity import invalidate_identity
+from api.utils.passwords import hash_password, verify_password, PasswordQueueFull
+from api.utils.serialization import jsonify
+from api.routes.auth import busy_response
 
 
 user = Blueprint("user", __name__, url_prefix="/api/v1/user")
@@ -16,21 +20,11 @@ user = Blueprint("user", __name__, url_prefix="/api/v1/user")
 @user.get("/")
 @jwt_required()
 def get_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-
     try:
-        first_name = user.first_name
-        last_name = user.last_name
-        email = user.email
-        avatar = user.avatar
-        if avatar:
-            with open(os.path.join('data/imgs', avatar), 'rb') as binary_file:
-                binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
-                base64_avatar = base64_encoded_data.decode('utf-8')
-        else:
-            base64_avatar = ''
+        first_name = current_user.first_name
+        last_name = current_user.last_name
+        email = current_user.email
+        avatar = avatar_url(current_user.avatar)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -42,7 +36,7 @@ def get_user():
         "first_name": first_name,
         "last_name": last_name,
         "email": email,
-        "avatar": base64_avatar
+        "avatar_url": avatar
     }), 200
 
 
@@ -51,20 +45,12 @@ def get_user():
 @jwt_required()
 def post_user():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
 
     try:
-        first_name = user.first_name
-        last_name = user.last_name
-        email = user.email
-        avatar = user.avatar
-        if avatar:
-            with open(os.path.join('data/imgs', avatar), 'rb') as binary_file:
-                binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
-                base64_avatar = base64_encoded_data.decode('utf-8')
-        else:
-            base64_avatar = ''
+        first_name = current_user.first_name
+        last_name = current_user.last_name
+        email = current_user.email
+        avatar = avatar_url(current_user.avatar)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -77,41 +63,74 @@ def post_user():
         "first_name": first_name,
         "last_name": last_name,
         "email": email,
-        "avatar": base64_avatar
+        "avatar_url": avatar
     }), 201
 
 
 
+@user.get("/avatar/<filename>")
+def get_avatar(filename):
+    filename = secure_filename(filename)
+    size = request.args.get("size", default=DEFAULT_SIZE, type=int)
+
+    if size not in SIZES:
+        return jsonify({ "error": "unsupported avatar size" }), 400
+
+    stored = stored_avatar(filename, size)
+    if stored is None:
+        return jsonify({ "error": "avatar not found" }), 404
+
+    # Sent through wsgi.file_wrapper, which gunicorn serves with sendfile.
+    # Digest URLs change along with the image, so they are cached for a year;
+    # flat avatars are revalidated against their ETag every time.
+    path, etag, mimetype, immutable = stored
+    response = send_file(os.path.abspath(path), mimetype=mimetype, etag=etag, conditional=True,
+                         max_age=31536000 if immutable else None)
+    if immutable:
+        response.cache_control.immutable = True
+
+    # Flat avatars were stored as uploaded, so browsers must not sniff them
+    # into anything but the image type they were checked to be
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+
 @user.get("/urls")
 @jwt_required()
+@read_only
 def get_user_urls():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
-        urls = user.urls
+        limit = parse_page_size(request.args.get("limit", default=None, type=int))
+        cursor = request.args.get("cursor", default=None, type=str)
+
+        # Newest first by when the user got the url, walking the owner's
+        # (user_id, created_at, url_id) index
+        query = db.session.query(Url.id, Url.short_url, Url.long_url, Url.is_private, url_owners.c.created_at)\
+                .join(url_owners, url_owners.c.url_id==Url.id)\
+                .filter(url_owners.c.user_id==user_id)\
+                .order_by(desc(url_owners.c.created_at), desc(url_owners.c.url_id))
+
+        if cursor:
+            position = decode_cursor(cursor)
+            if not position:
+                return jsonify({'error': 'invalid cursor'}), 400
+            query = query.filter(tuple_(url_owners.c.created_at, url_owners.c.url_id) < position)
+
+        urls = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(urls[limit - 1].created_at, urls[limit - 1].id) if len(urls) > limit else None
+
         user_urls = [{
                         "id": url.id,
                         "short_url": url.short_url, 
                         "long_url": url.long_url,
                         "alias": url.short_url[10:],
                         "private": url.is_private 
-                    } for url in urls]
-
-        url_pie = db.session.query(Url, func.count(Url.visits))\
-                .filter(Url.users.contains(user))\
-                .outerjoin(Visit, Url.id==Visit.url_id)\
-                .group_by(Url).order_by(desc(func.count(Url.visits)))\
-                .limit(5)\
-                .all()
-
-        sum_urls = sum([stat[1] for stat in url_pie])
+                    } for url in urls[:limit]]
 
-        url_stats = [{
-                    'x': stat[0].short_url,
-                    'y': stat[1],
-                    'text': (str(round((stat[1]/sum_urls * 100), 1)) + '%') if sum_urls > 0 else '0%' 
-                } for stat in url_pie]
+        url_stats = user_analytics(user_id)['url_pie']
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -121,6 +140,7 @@ def get_user_urls():
 
     return jsonify({
         'urls': user_urls,
+        'next_cursor': next_cursor,
         'top_stats': url_stats
     }), 200
 
@@ -128,34 +148,35 @@ def get_user_urls():
 
 @user.get("/documents")
 @jwt_required()
+@read_only
 def get_user_documents():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
-        documents = sorted(user.documents, key=lambda x: x.created_at)[::-1]
+        limit = parse_page_size(request.args.get("limit", default=None, type=int))
+        cursor = request.args.get("cursor", default=None, type=str)
+
+        query = db.session.query(Document.id, Document.title, Document.is_private, Document.created_at, Document.snippet)\
+                .filter(Document.user_id==user_id)\
+                .order_by(desc(Document.created_at), desc(Document.id))
+
+        if cursor:
+            position = decode_cursor(cursor)
+            if not position:
+                return jsonify({'error': 'invalid cursor'}), 400
+            query = query.filter(tuple_(Document.created_at, Document.id) < position)
+
+        documents = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(documents[limit - 1].created_at, documents[limit - 1].id) if len(documents) > limit else None
+
         user_documents = [{
                         "id": document.id,
                         "title": document.title, 
-                        "plain_text": document.plain_text,
+                        "snippet": document.snippet,
                         "private": document.is_private 
-                    } for document in documents]
+                    } for document in documents[:limit]]
 
-        document_pie = db.session.query(Document, func.count(Document.visits))\
-                    .filter(Document.user == user)\
-                    .outerjoin(Visit, Document.id==Visit.document_id)\
-                    .group_by(Document)\
-                    .order_by(desc(func.count(Document.visits)))\
-                    .limit(5)\
-                    .all()
-
-        sum_documents = sum([stat[1] for stat in document_pie])
-
-        document_top_stats = [{
-                                'x': stat[0].title,
-                                'y': stat[1],
-                                'text': (str(round((stat[1]/sum_documents * 100), 1)) + '%')if sum_documents > 0 else '0%'
-                            } for stat in document_pie]
+        document_stats = user_analytics(user_id)['document_pie']
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -165,7 +186,8 @@ def get_user_documents():
 
     return jsonify({
         'documents': user_documents,
-        'top_stats': document_top_stats
+        'next_cursor': next_cursor,
+        'top_stats': document_stats
     }), 200
 
 
@@ -188,34 +210,33 @@ def edit_user():
         if not validate_email(email):
             return jsonify({ "error": "invalid email" }), 400
 
-        if avatar:
-            # filename = secure_filename(user_id + avatar.filename)
-            file_extension = get_file_extension(avatar.filename)
-            filename = secure_filename(user_id + file_extension)
-            avatar.save(os.path.join('data/imgs', filename))
-
-            with open(os.path.join('data/imgs', filename), 'rb') as binary_file:
-                binary_file_data = binary_file.read()
-                base64_encoded_data = base64.b64encode(binary_file_data)
-                base64_avatar = base64_encoded_data.decode('utf-8')
-        else:
-            base64_avatar = ''
-        
-        user_with_email = User.query.filter_by(email=email).first()
-
-        if user_with_email and (user_with_email.id != user.id):
+        # Only a changed email can collide with another user
+        if email != user.email and db.session.query(User.id).filter_by(email=email).first():
             return jsonify({ "error": "email already in use by another user" }), 409
 
+        stale_avatar = None
         if avatar:
+            try:
+                filename = save_avatar(avatar)
+            except InvalidImage:
+                return jsonify({ "error": "invalid image" }), 400
+
+            # Identical uploads share a file, so only drop one nobody else uses
             prev_avatar = user.avatar
-            if prev_avatar and os.path.exists(prev_avatar):
-                os.remove(prev_avatar)
+            if prev_avatar and prev_avatar != filename:
+                if not User.query.filter(User.avatar == prev_avatar, User.id != user.id).first():
+                    stale_avatar = prev_avatar
             user.avatar = filename
 
         user.first_name = first_name
         user.last_name = last_name
         user.email = email
+        avatar = avatar_url(user.avatar)
         db.session.commit()
+        invalidate_identity(user_id)
+
+        if stale_avatar:
+            remove_avatar(stale_avatar)
 
     except Exception as e:
         db.session.rollback()
@@ -229,7 +250,7 @@ def edit_user():
         "first_name": first_name,
         "last_name": last_name,
         "email": email,
-        "avatar": base64_avatar
+        "avatar_url": avatar
     }), 201
 
 
@@ -244,14 +265,19 @@ def change_password():
         old_password = request.json.get("old_password", None)
         new_password = request.json.get("new_password", None)
 
-        if not check_password_hash(user.password, old_password):
+        if not verify_password(user.password, old_password):
             return jsonify({ 'error': 'invalid credentials' }), 401
 
         if not (validate_password(new_password) and validate_password(old_password)):
             return jsonify({ "error": "password must be minimum of 3 characters" }), 400
         
-        user.password = generate_password_hash(new_password)
+        user.password = hash_password(new_password)
         db.session.commit()
+        invalidate_identity(user_id)
+
+    except PasswordQueueFull:
+        db.session.rollback()
+        return busy_response()
 
     except Exception as e:
         db.session.rollback()
@@ -266,76 +292,13 @@ def change_password():
 
 @user.get("/stats")
 @jwt_required()
+@read_only
 def get_user_stats():
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
 
-        one_year_ago = datetime.now() - timedelta(days=365)
-
-        url_grouped = db.session.query(func.date_part('YEAR', func.date(Visit.time)), func.date_part('MONTH', func.date(Visit.time)), func.count(Visit.url_id))\
-                        .join(Url)\
-                        .filter(Url.users.contains(user))\
-                        .filter(Visit.time.between(one_year_ago, datetime.utcnow()))\
-                        .group_by(func.date_part('YEAR', func.date(Visit.time)), func.date_part('MONTH', func.date(Visit.time)))\
-                        .order_by(asc(func.date_part('YEAR', func.date(Visit.time))), asc(func.date_part('MONTH', func.date(Visit.time))))\
-                        .all()
-        document_grouped = db.session.query(func.date_part('YEAR', func.date(Visit.time)), func.date_part('MONTH', func.date(Visit.time)), func.count(Visit.document_id))\
-                            .join(Document)\
-                            .filter(Document.user == user)\
-                            .filter(Visit.time.between(one_year_ago, datetime.utcnow()))\
-                            .group_by(func.date_part('YEAR', func.date(Visit.time)), func.date_part('MONTH', func.date(Visit.time)))\
-                            .order_by(asc(func.date_part('YEAR', func.date(Visit.time))), asc(func.date_part('MONTH', func.date(Visit.time))))\
-                            .all()
-
-        stacked_url = [{
-                        'x': number_to_month[int(stat[1])],
-                        'y': stat[2]
-                    } for stat in url_grouped]
-        stacked_document = [{
-                        'x': number_to_month[int(stat[1])],
-                        'y': stat[2]
-                    } for stat in document_grouped]
-
-        line_url = [{
-                        'x': [int(stat[0]), int(stat[1])],
-                        'y': stat[2]
-                    } for stat in url_grouped]
-        line_document = [{
-                        'x': [int(stat[0]), int(stat[1])],
-                        'y': stat[2]
-                    } for stat in document_grouped]
-
-
-        url_pie = db.session.query(Url, func.count(Url.visits))\
-                    .filter(Url.users.contains(user))\
-                    .outerjoin(Visit, Url.id==Visit.url_id)\
-                    .group_by(Url)\
-                    .order_by(desc(func.count(Url.visits)))\
-                    .limit(5)\
-                    .all()
-        document_pie = db.session.query(Document, func.count(Document.visits))\
-                    .filter(Document.user == user)\
-                    .outerjoin(Visit, Document.id==Visit.document_id)\
-                    .group_by(Document)\
-                    .order_by(desc(func.count(Document.visits)))\
-                    .limit(5)\
-                    .all()
-
-        sum_urls = sum([stat[1] for stat in url_pie])
-        sum_documents = sum([stat[1] for stat in document_pie])
-
-        url_top_stats = [{
-                        'x': stat[0].short_url,
-                        'y': stat[1],
-                        'text': (str(round((stat[1]/sum_urls * 100), 1)) + '%') if sum_urls > 0 else '0%'
-                    } for stat in url_pie]
-        document_top_stats = [{
-                                'x': stat[0].title,
-                                'y': stat[1],
-                                'text': (str(round((stat[1]/sum_documents * 100), 1)) + '%')if sum_documents > 0 else '0%'
-                            } for stat in document_pie]
-    
+        analytics = user_analytics(user_id)
+
     except Exception as e:
         db.session.rollback()
         return jsonify({ 'error': str(e) }), 400
@@ -344,8 +307,8 @@ def get_user_stats():
         db.session.close()
     
     return jsonify({
-        'url_pie': url_top_stats,
-        'document_pie': document_top_stats,
-        'stacked': [stacked_url, stacked_document],
-        'line': [line_url, line_document]
+        'url_pie': analytics['url_pie'],
+        'document_pie': analytics['document_pie'],
+        'stacked': analytics['stacked'],
+        'line': analytics['line']
     }), 200
\ No newline at end of file
@@ -0,0 +1,66 @@
+from sqlalchemy import select
+from api.models import db, Document, document_shared_users
+from api.utils.cache import TTLCache, MISSING
+
+
+OWNER = 'owner'
+EDITOR = 'editor'
+VIEWER = 'viewer'
+
+# Permissions a document can be shared with
+VIEW = 'view'
+EDIT = 'edit'
+PERMISSIONS = (VIEW, EDIT)
+
+# (document id, acl_version, user id) -> the user's share permission, or
+# MISSING without a share. Sharing changes bump documents.acl_version, which
+# the request has already read with the document row, so every worker stops
+# using older decisions at once and the TTL only bounds memory.
+acl_cache = TTLCache()
+
+
+def share_permission(user_id, document):
+    key = (document.id, document.acl_version, user_id)
+    permission = acl_cache.get(key)
+
+    if permission is None:
+        permission = db.session.execute(
+            select(document_shared_users.c.permission)
+            .where(document_shared_users.c.document_id == document.id, document_shared_users.c.user_id == user_id)
+        ).scalar()
+        permission = permission or MISSING
+        acl_cache.set(key, permission)
+
+    return None if permission is MISSING else permission
+
+
+def document_role(user_id, document):
+    # owner, editor, viewer or None. Privacy is read from the loaded row, so
+    # toggling it takes effect without touching the cache.
+    if user_id == document.user_id:
+        return OWNER
+
+    permission = share_permission(user_id, document)
+    if permission == EDIT:
+        return EDITOR
+    if permission == VIEW or not document.is_private:
+        return VIEWER
+    return None
+
+
+def can_view(user_id, document):
+    # Public documents need no lookup, so the common read stays query free
+    if not document.is_private:
+        return True
+    return document_role(user_id, document) is not None
+
+
+def can_edit(user_id, document):
+    return document_role(user_id, document) in (OWNER, EDITOR)
+
+
+def bump_acl_version(document_id):
+    # A bulk update, so it doesn't bump the document revision
+    db.session.query(Document)\
+        .filter(Document.id == document_id)\
+        .update({ Document.acl_version: Document.acl_version + 1 }, synchronize_session=False)
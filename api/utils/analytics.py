@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, desc, asc, select, union
+from api.models import db, Url, Document, DailyVisitRollup, user_urls
+from api.utils.helpers import number_to_month
+from api.utils.cache import TTLCache
+from api.utils.routing import replica_router, on_replica, wrote_recently
+
+
+# user id -> (the series shared by /user/stats, /user/urls and
+# /user/documents, whether they were read from a replica)
+analytics_cache = TTLCache()
+
+
+def _pie(rows, label):
+    total = sum([row[1] for row in rows])
+
+    return [{
+                'x': label(row[0]),
+                'y': row[1],
+                'text': (str(round((row[1]/total * 100), 1)) + '%') if total > 0 else '0%'
+            } for row in rows]
+
+
+def url_top_stats(user_id):
+    visits = func.coalesce(func.sum(DailyVisitRollup.count), 0)
+    url_pie = db.session.query(Url, visits)\
+                .join(user_urls, user_urls.c.url_id==Url.id)\
+                .filter(user_urls.c.user_id==user_id)\
+                .outerjoin(DailyVisitRollup, Url.id==DailyVisitRollup.url_id)\
+                .group_by(Url)\
+                .order_by(desc(visits))\
+                .limit(5)\
+                .all()
+
+    return _pie(url_pie, lambda url: url.short_url)
+
+
+def document_top_stats(user_id):
+    visits = func.coalesce(func.sum(DailyVisitRollup.count), 0)
+    document_pie = db.session.query(Document, visits)\
+                    .filter(Document.user_id == user_id)\
+                    .outerjoin(DailyVisitRollup, Document.id==DailyVisitRollup.document_id)\
+                    .group_by(Document)\
+                    .order_by(desc(visits))\
+                    .limit(5)\
+                    .all()
+
+    return _pie(document_pie, lambda document: document.title)
+
+
+def _monthly(query):
+    # Daily buckets, so the first day of the window is counted in full
+    one_year_ago = (datetime.utcnow() - timedelta(days=365)).date()
+    year = func.date_part('YEAR', DailyVisitRollup.bucket)
+    month = func.date_part('MONTH', DailyVisitRollup.bucket)
+
+    return query.filter(DailyVisitRollup.bucket >= one_year_ago)\
+                .group_by(year, month)\
+                .order_by(asc(year), asc(month))\
+                .with_entities(year, month, func.sum(DailyVisitRollup.count))\
+                .all()
+
+
+def monthly_url_visits(user_id):
+    return _monthly(db.session.query(DailyVisitRollup)\
+                    .join(user_urls, user_urls.c.url_id==DailyVisitRollup.url_id)\
+                    .filter(user_urls.c.user_id==user_id))
+
+
+def monthly_document_visits(user_id):
+    return _monthly(db.session.query(DailyVisitRollup)\
+                    .join(Document, Document.id==DailyVisitRollup.document_id)\
+                    .filter(Document.user_id == user_id))
+
+
+def global_url_top_stats():
+    visits = func.sum(DailyVisitRollup.count)
+    url_pie = db.session.query(Url, visits)\
+                .join(DailyVisitRollup, Url.id==DailyVisitRollup.url_id)\
+                .filter(Url.is_private == False)\
+                .group_by(Url)\
+                .order_by(desc(visits))\
+                .limit(5)\
+                .all()
+
+    return _pie(url_pie, lambda url: url.short_url)
+
+
+def global_document_top_stats():
+    visits = func.sum(DailyVisitRollup.count)
+    document_pie = db.session.query(Document, visits)\
+                    .join(DailyVisitRollup, Document.id==DailyVisitRollup.document_id)\
+                    .filter(Document.is_private == False)\
+                    .group_by(Document)\
+                    .order_by(desc(visits))\
+                    .limit(5)\
+                    .all()
+
+    return _pie(document_pie, lambda document: document.title)
+
+
+def global_monthly_url_visits():
+    return _monthly(db.session.query(DailyVisitRollup).filter(DailyVisitRollup.url_id.isnot(None)))
+
+
+def global_monthly_document_visits():
+    return _monthly(db.session.query(DailyVisitRollup).filter(DailyVisitRollup.document_id.isnot(None)))
+
+
+def stacked_series(grouped):
+    return [{
+                'x': number_to_month[int(stat[1])],
+                'y': int(stat[2])
+            } for stat in grouped]
+
+
+def line_series(grouped):
+    return [{
+                'x': [int(stat[0]), int(stat[1])],
+                'y': int(stat[2])
+            } for stat in grouped]
+
+
+def user_analytics(user_id):
+    entry = analytics_cache.get(user_id)
+
+    # Series read from a replica may miss this user's own recent writes, which
+    # their reads on the primary have to see
+    if entry is None or (entry[1] and wrote_recently()):
+        url_grouped = monthly_url_visits(user_id)
+        document_grouped = monthly_document_visits(user_id)
+        analytics = {
+            'url_pie': url_top_stats(user_id),
+            'document_pie': document_top_stats(user_id),
+            'stacked': [stacked_series(url_grouped), stacked_series(document_grouped)],
+            'line': [line_series(url_grouped), line_series(document_grouped)]
+        }
+        # A replica may also be behind the invalidations, which happen on the
+        # primary, so what it returned is only kept as long as a write is
+        # assumed to take to reach it
+        entry = analytics, on_replica()
+        ttl = min(analytics_cache.ttl, replica_router.after_write) if entry[1] else None
+        analytics_cache.set(user_id, entry, ttl=ttl)
+
+    return entry[0]
+
+
+def invalidate_user_analytics(*user_ids):
+    for user_id in user_ids:
+        analytics_cache.delete(user_id)
+
+
+def invalidate_visited(rows):
+    # Drops cached analytics of the users owning a url or document in `rows`.
+    # Only users cached here are looked up, so a url with many owners costs
+    # no more than one owned once. Other workers keep their entries until
+    # ANALYTICS_CACHE_TTL expires them, as do visits recorded synchronously.
+    cached = analytics_cache.keys()
+    if not cached:
+        return
+
+    url_ids = { row['url_id'] for row in rows if row['url_id'] }
+    document_ids = { row['document_id'] for row in rows if row['document_id'] }
+
+    owners = union(
+        select(user_urls.c.user_id).where(user_urls.c.user_id.in_(cached), user_urls.c.url_id.in_(list(url_ids))),
+        select(Document.user_id).where(Document.user_id.in_(cached), Document.id.in_(list(document_ids)))
+    )
+    invalidate_user_analytics(*[user_id for (user_id,) in db.session.execute(owners)])
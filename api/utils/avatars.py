@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import click
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import NamedTemporaryFile, mkdtemp
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from PIL import Image, ImageOps, UnidentifiedImageError
+from api.models import db, User
+from api.utils.cache import TTLCache, MISSING
+
+
+AVATAR_DIR = 'data/imgs'
+CHUNK_SIZE = 64 * 1024
+SIZES = (256, 128, 64)
+DEFAULT_SIZE = SIZES[0]
+
+# Processed avatars are stored as AVATAR_DIR/ab/cd/<digest>/<size>.webp and
+# users.avatar holds just the digest of the original upload
+DIGEST = re.compile(r'^[0-9a-f]{32}$')
+
+# Flat files written before processing existed sit directly in AVATAR_DIR,
+# named after the user id. User ids look just like digests, so the two
+# layouts are told apart by what is on disk, never by the name. Flat files
+# were stored as uploaded and are only ever served as one of these.
+LEGACY_MIMETYPES = { 'PNG': 'image/png', 'JPEG': 'image/jpeg', 'GIF': 'image/gif', 'WEBP': 'image/webp' }
+
+# (filename, mtime) -> (digest, mimetype), or None for files that aren't served
+_legacy_files = TTLCache(maxsize=1024, ttl=3600)
+
+_pool = None
+_pool_pid = None
+_pool_lock = Lock()
+
+avatars_cli = AppGroup('avatars', help='Maintain stored avatars.')
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _digest_file(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as binary_file:
+        for chunk in iter(lambda: binary_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_legacy(avatar):
+    return os.path.isfile(os.path.join(AVATAR_DIR, avatar))
+
+
+def is_processed(avatar):
+    return bool(DIGEST.match(avatar)) and not is_legacy(avatar)
+
+
+def avatar_dir(digest):
+    return os.path.join(AVATAR_DIR, digest[:2], digest[2:4], digest)
+
+
+def avatar_path(avatar, size=DEFAULT_SIZE):
+    if is_processed(avatar):
+        return os.path.join(avatar_dir(avatar), f'{size}.webp')
+    return os.path.join(AVATAR_DIR, avatar)
+
+
+def avatar_url(avatar, size=DEFAULT_SIZE):
+    if not avatar:
+        return ''
+    if is_processed(avatar):
+        return url_for('user.get_avatar', filename=avatar, size=size)
+    return url_for('user.get_avatar', filename=avatar)
+
+
+def _legacy_file(avatar):
+    path = avatar_path(avatar)
+    key = (avatar, os.stat(path).st_mtime_ns)
+    entry = _legacy_files.get(key, MISSING)
+
+    if entry is MISSING:
+        # The format comes from the file's contents, not its extension
+        try:
+            with Image.open(path) as image:
+                mimetype = LEGACY_MIMETYPES.get(image.format)
+        except (UnidentifiedImageError, OSError):
+            mimetype = None
+        entry = (_digest_file(path), mimetype) if mimetype else None
+        _legacy_files.set(key, entry)
+
+    return entry
+
+
+def stored_avatar(avatar, size=DEFAULT_SIZE):
+    # (path, etag, mimetype, immutable) of the file to send, or None
+    if is_legacy(avatar):
+        legacy = _legacy_file(avatar)
+        if legacy is None:
+            return None
+        etag, mimetype = legacy
+        return avatar_path(avatar), etag, mimetype, False
+
+    if DIGEST.match(avatar):
+        path = avatar_path(avatar, size)
+        if os.path.isfile(path):
+            return path, f'{avatar}-{size}', 'image/webp', True
+
+    return None
+
+
+def render_thumbnails(source, target):
+    # Runs in the process pool: decode once, then write every size as webp
+    # into a scratch directory that is renamed into place when complete
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(str(e))
+
+    scratch = mkdtemp(dir=AVATAR_DIR)
+    try:
+        for size in SIZES:
+            thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            thumbnail.save(os.path.join(scratch, f'{size}.webp'), 'WEBP', quality=80, method=4)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.rename(scratch, target)
+        except OSError:
+            # Another worker stored the same image first
+            if not os.path.isdir(target):
+                raise
+            shutil.rmtree(scratch, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+
+def _get_pool():
+    global _pool, _pool_pid
+
+    # Pools don't survive a fork, so each gunicorn worker starts its own
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=current_app.config['AVATAR_WORKERS'])
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def save_avatar(file):
+    # Streams the upload to disk while hashing it. Known images are reused
+    # as they are, new ones are resized in the process pool.
+    digest = hashlib.blake2b(digest_size=16)
+
+    with NamedTemporaryFile(dir=AVATAR_DIR, delete=False) as temporary_file:
+        for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temporary_file.write(chunk)
+
+    digest = digest.hexdigest()
+    try:
+        try:
+            # Reusing a stored image restarts its grace period, see collect_garbage
+            os.utime(avatar_dir(digest))
+        except FileNotFoundError:
+            future = _get_pool().submit(render_thumbnails, temporary_file.name, avatar_dir(digest))
+            future.result(timeout=current_app.config['AVATAR_PROCESS_TIMEOUT'])
+    finally:
+        os.remove(temporary_file.name)
+
+    return digest
+
+
+def remove_avatar(avatar):
+    path = avatar_dir(avatar) if is_processed(avatar) else avatar_path(avatar)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _stored_avatars():
+    for root, dirs, files in os.walk(AVATAR_DIR):
+        depth = os.path.relpath(root, AVATAR_DIR).count(os.sep) + 1 if root != AVATAR_DIR else 0
+
+        if depth == 0:
+            for filename in files:
+                if not filename.startswith('.') and not filename.startswith('tmp'):
+                    yield filename
+        if depth == 2:
+            for digest in dirs:
+                if DIGEST.match(digest):
+                    yield digest
+            dirs[:] = []
+
+
+def _stored_at(avatar):
+    path = avatar_dir(avatar) if is_processed(avatar) else avatar_path(avatar)
+    return os.stat(path).st_mtime
+
+
+@avatars_cli.command('gc')
+@click.option('--grace', default=3600, help='Seconds a stored avatar is kept before it can be collected.')
+def collect_garbage(grace):
+    """Delete stored avatars that no user references."""
+    referenced = { avatar for (avatar,) in db.session.query(User.avatar).filter(User.avatar.isnot(None)) }
+    db.session.close()
+
+    # Uploads write their directory before users.avatar is committed, so
+    # recent ones aren't referenced yet and are left for a later run
+    cutoff = time.time() - grace
+    removed = 0
+    for avatar in list(_stored_avatars()):
+        if avatar in referenced:
+            continue
+        try:
+            if _stored_at(avatar) > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        remove_avatar(avatar)
+        removed += 1
+
+    click.echo(f'removed {removed} unreferenced avatars')
+
+
+@avatars_cli.command('migrate')
+def migrate_avatars():
+    """Process flat avatar files into the content-addressed layout."""
+    migrated = 0
+    for user in User.query.filter(User.avatar.isnot(None)).all():
+        if not is_legacy(user.avatar):
+            continue
+
+        digest = _digest_file(avatar_path(user.avatar))
+        try:
+            if not os.path.isdir(avatar_dir(digest)):
+                render_thumbnails(avatar_path(user.avatar), avatar_dir(digest))
+        except InvalidImage as e:
+            click.echo(f'skipping {user.avatar}: {e}')
+            continue
+
+        user.avatar = digest
+        migrated += 1
+
+    db.session.commit()
+    db.session.close()
+    click.echo(f'migrated {migrated} avatars, run "flask avatars gc" to drop the originals')
@@ -0,0 +1,91 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, or_, bindparam
+from sqlalchemy.orm import undefer
+from api.models import db, Document, CompressedText
+from api.utils.search import index_document
+
+
+documents_cli = AppGroup('documents', help='Maintain stored documents.')
+
+
+def _stored_raw(column, threshold):
+    return (func.get_byte(column, 0) == 0) & (func.octet_length(column) > threshold)
+
+
+@documents_cli.command('compress')
+@click.option('--batch-size', default=200, help='Documents rewritten per transaction.')
+def compress_documents(batch_size):
+    """Compress bodies that were stored before compression was enabled."""
+    threshold = CompressedText().threshold
+    table = Document.__table__
+    last_id = ''
+    rewritten = 0
+
+    # A storage-only rewrite, so it goes around the ORM: updated_at is set to
+    # itself and the revision is left alone, which keeps ETags, Last-Modified
+    # and history as they were. Documents edited in the meantime are skipped,
+    # their edit already stored them compressed.
+    rewrite = table.update()\
+                .where(table.c.id == bindparam('document_id'))\
+                .where(table.c.revision == bindparam('stored_revision'))\
+                .values(
+                    html_text=bindparam('stored_html_text', type_=table.c.html_text.type),
+                    plain_text=bindparam('stored_plain_text', type_=table.c.plain_text.type),
+                    updated_at=table.c.updated_at
+                )
+
+    while True:
+        documents = db.session.query(Document.id, Document.revision, Document.html_text, Document.plain_text)\
+                    .filter(Document.id > last_id)\
+                    .filter(or_(_stored_raw(Document.html_text, threshold), _stored_raw(Document.plain_text, threshold)))\
+                    .order_by(Document.id)\
+                    .limit(batch_size)\
+                    .all()
+
+        if not documents:
+            break
+
+        result = db.session.execute(rewrite, [{
+                    'document_id': document.id,
+                    'stored_revision': document.revision,
+                    'stored_html_text': document.html_text,
+                    'stored_plain_text': document.plain_text
+                } for document in documents])
+        last_id = documents[-1].id
+        rewritten += result.rowcount
+
+        db.session.commit()
+
+    db.session.close()
+    click.echo(f'rewrote {rewritten} documents')
+
+
+@documents_cli.command('reindex')
+@click.option('--batch-size', default=200, help='Documents indexed per transaction.')
+def reindex_documents(batch_size):
+    """Build or refresh the search index for every document."""
+    last_id = ''
+    indexed = 0
+
+    while True:
+        documents = Document.query\
+                    .options(undefer(Document.plain_text))\
+                    .filter(Document.id > last_id)\
+                    .order_by(Document.id)\
+                    .limit(batch_size)\
+                    .all()
+
+        if not documents:
+            break
+
+        for document in documents:
+            index_document(document.id, document.title, document.plain_text)
+        last_id = documents[-1].id
+        indexed += len(documents)
+
+        db.session.commit()
+        db.session.expunge_all()
+
+    db.session.close()
+    click.echo(f'indexed {indexed} documents')
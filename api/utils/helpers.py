@@ -1,7 +1,13 @@
 import re
 import string
-import random
-from api.models import Url
+import base64
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from api.models import db, Url
+from api.utils.cache import alias_cache, MISSING
+from api.utils.shortcode import short_code_allocator
+from api.utils.membership import add_url_owner
 
 def validate_name(name):
     return type(name) == str and len(name) > 1
@@ -40,12 +46,62 @@ def sanitize_long_url(url):
     return url
 
 def generate_short_url(url):
-    string_choice = string.ascii_letters + string.digits
-    short_url = "".join([random.choice(string_choice) for _ in range(7)])
+    return f"urrl.link/{short_code_allocator.next_code()}"
+
+def commit_with_short_url(new_url, attempts=3, owner_id=None):
+    # Allocated codes are unique among themselves but can still meet a custom
+    # alias or a randomly drawn code issued before the allocator, so retry on
+    # the unique constraint
+    for attempt in range(attempts):
+        try:
+            with db.session.begin_nested():
+                db.session.add(new_url)
+            break
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+            new_url.short_url = generate_short_url(new_url.long_url)
+
+    if owner_id:
+        add_url_owner(owner_id, new_url.id)
+
+    short_url = new_url.short_url
+    db.session.commit()
+    return short_url
+
+def resolve_short_url(short_url):
+    # Returns (url id, long_url, is_private) or None, consulting the alias cache first
+    cached = alias_cache.get(short_url)
+
+    if cached is None:
+        url = Url.query.filter_by(short_url=short_url).first()
+        if url:
+            cached = (url.id, url.long_url, url.is_private)
+            alias_cache.set(short_url, cached)
+        else:
+            cached = MISSING
+            alias_cache.set(short_url, MISSING, ttl=current_app.config['ALIAS_CACHE_NEGATIVE_TTL'])
+
+    return None if cached is MISSING else cached
+
+def parse_page_size(limit):
+    if limit is None:
+        return PAGE_SIZE
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+def encode_cursor(created_at, id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor):
+    # Returns the (created_at, id) position a page starts after, or None if malformed
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), id
+    except Exception:
+        return None
 
-    while Url.query.filter_by(short_url=short_url).first():
-        short_url = "".join([random.choice(string_choice) for _ in range(7)])
-    return f"urrl.link/{short_url}"
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
 
 number_to_month = {
     1: 'Jan',
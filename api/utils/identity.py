@@ -0,0 +1,55 @@
+from api.models import db, User
+from api.utils.cache import TTLCache
+
+
+# What routes read about the signed-in user. The password hash is left out;
+# the few routes that check it load the user themselves.
+PROFILE_COLUMNS = ('first_name', 'last_name', 'email', 'avatar')
+
+# user id -> profile columns. Edits only drop the entry of the worker that
+# made them, so other workers see edits, and deleted users, once the TTL
+# runs out.
+identity_cache = TTLCache()
+
+
+def load_profile(user_id):
+    profile = identity_cache.get(user_id)
+
+    if profile is None:
+        row = db.session.query(*[getattr(User, column) for column in PROFILE_COLUMNS])\
+                .filter(User.id == user_id)\
+                .first()
+        if row is None:
+            raise LookupError('user not found')
+        profile = dict(zip(PROFILE_COLUMNS, row))
+        identity_cache.set(user_id, profile)
+
+    return profile
+
+
+def invalidate_identity(user_id):
+    identity_cache.delete(user_id)
+
+
+def load_identity(user_id):
+    # None once the user is gone, which flask_jwt_extended turns into a 401.
+    # Cached, so a worker reads each signed-in user at most once per TTL.
+    try:
+        return Identity(user_id, load_profile(user_id))
+    except LookupError:
+        return None
+
+
+class Identity:
+    # flask_jwt_extended's current_user: the id and the cached profile
+    # columns, never the password hash.
+    __slots__ = ('id', '_profile')
+
+    def __init__(self, user_id, profile):
+        self.id = user_id
+        self._profile = profile
+
+    def __getattr__(self, name):
+        if name not in PROFILE_COLUMNS:
+            raise AttributeError(name)
+        return self._profile[name]
@@ -0,0 +1,43 @@
+from sqlalchemy import exists
+from sqlalchemy.dialects.postgresql import insert
+from api.models import db, user_urls, document_shared_users
+
+
+# Membership checks and changes on the association tables. Each one is a
+# single probe or statement on the unique (owner, target) index instead of
+# loading `url.users` or `document.users_sharing`, which can be very long.
+
+
+def owns_url(user_id, url_id):
+    return db.session.query(exists().where(user_urls.c.user_id == user_id, user_urls.c.url_id == url_id)).scalar()
+
+
+def add_url_owner(user_id, url_id):
+    # True if the user didn't own the url yet
+    statement = insert(user_urls).values(user_id=user_id, url_id=url_id)\
+                    .on_conflict_do_nothing(index_elements=['user_id', 'url_id'])
+    return db.session.execute(statement).rowcount > 0
+
+
+def remove_url_owner(user_id, url_id):
+    # True if the user owned the url
+    statement = user_urls.delete().where(user_urls.c.user_id == user_id, user_urls.c.url_id == url_id)
+    return db.session.execute(statement).rowcount > 0
+
+
+def share_document(document_id, user_id, permission):
+    # Shares the document, or changes the permission of an existing share
+    statement = insert(document_shared_users).values(document_id=document_id, user_id=user_id, permission=permission)
+    statement = statement.on_conflict_do_update(
+        index_elements=['document_id', 'user_id'],
+        set_={ 'permission': statement.excluded['permission'] }
+    )
+    return db.session.execute(statement).rowcount > 0
+
+
+def unshare_document(document_id, user_id):
+    statement = document_shared_users.delete().where(
+        document_shared_users.c.document_id == document_id,
+        document_shared_users.c.user_id == user_id
+    )
+    return db.session.execute(statement).rowcount > 0
@@ -0,0 +1,143 @@
+import os
+import hmac
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import Counter, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from api.utils.cache import alias_cache
+from api.utils.analytics import analytics_cache
+from api.utils.acl import acl_cache
+from api.utils.identity import identity_cache
+
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker writes
+# its samples there and a scrape of any worker returns the sum over all of
+# them. Without it each worker only reports its own requests.
+
+LATENCY = Histogram('urrl_request_duration_seconds', 'Request latency.', ['endpoint', 'method'])
+REQUESTS = Counter('urrl_requests_total', 'Requests served.', ['endpoint', 'method', 'status'])
+QUERIES = Histogram('urrl_request_queries', 'SQL queries per request.', ['endpoint'],
+                    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250))
+QUERY_TIME = Histogram('urrl_request_query_seconds', 'Time spent in SQL per request.', ['endpoint'])
+ROWS = Counter('urrl_request_rows_total', 'Rows returned by SQL queries.', ['endpoint'])
+RESPONSE_BYTES = Histogram('urrl_response_bytes', 'Response body size.', ['endpoint'],
+                           buckets=(128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+
+CACHES = {
+    'alias': alias_cache,
+    'analytics': analytics_cache,
+    'acl': acl_cache,
+    'identity': identity_cache
+}
+
+
+class CacheCollector:
+    # Cache statistics of the worker that answers the scrape
+
+    def collect(self):
+        size = GaugeMetricFamily('urrl_cache_entries', 'Entries held by an in-process cache.', labels=['cache'])
+        capacity = GaugeMetricFamily('urrl_cache_capacity', 'Maximum entries of an in-process cache.', labels=['cache'])
+        hits = CounterMetricFamily('urrl_cache_hits', 'Cache lookups that found an entry.', labels=['cache'])
+        misses = CounterMetricFamily('urrl_cache_misses', 'Cache lookups that found nothing.', labels=['cache'])
+        evictions = CounterMetricFamily('urrl_cache_evictions', 'Entries dropped to stay under capacity.', labels=['cache'])
+
+        for name, cache in CACHES.items():
+            stats = cache.stats()
+            size.add_metric([name], stats['size'])
+            capacity.add_metric([name], stats['maxsize'])
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            evictions.add_metric([name], stats['evictions'])
+
+        return [size, capacity, hits, misses, evictions]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_stats' in g:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None or not has_request_context() or 'query_stats' not in g:
+        return
+
+    stats = g.query_stats
+    stats['count'] += 1
+    stats['time'] += time.perf_counter() - started
+    # psycopg2 buffers results, so rowcount is the number of rows a SELECT returned
+    if cursor.description is not None and cursor.rowcount > 0:
+        stats['rows'] += cursor.rowcount
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.query_header = False
+        self.token = None
+        self._collector = None
+
+    def init_app(self, app):
+        self.query_header = app.config['METRICS_QUERY_HEADER']
+        self.token = app.config['METRICS_TOKEN']
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        if self._collector is None:
+            self._collector = CacheCollector()
+            REGISTRY.register(self._collector)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.query_stats = { 'count': 0, 'time': 0.0, 'rows': 0 }
+
+    def _finish(self, response):
+        if 'request_started' not in g:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'metrics':
+            return response
+
+        stats = g.query_stats
+        LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - g.request_started)
+        REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+        QUERIES.labels(endpoint).observe(stats['count'])
+        QUERY_TIME.labels(endpoint).observe(stats['time'])
+        ROWS.labels(endpoint).inc(stats['rows'])
+
+        # Streamed responses such as send_file may not know their length
+        if response.content_length is not None:
+            RESPONSE_BYTES.labels(endpoint).observe(response.content_length)
+
+        if self.query_header:
+            response.headers['X-Query-Count'] = str(stats['count'])
+            response.headers['X-Query-Time-Ms'] = f"{stats['time'] * 1000:.2f}"
+
+        return response
+
+    def authorized(self):
+        # Closed unless METRICS_TOKEN is set and presented as a bearer token
+        if not self.token:
+            return False
+        # As bytes, since compare_digest rejects str with non-ASCII characters
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), f"Bearer {self.token}".encode('utf-8'))
+
+    def render(self):
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            registry.register(self._collector)
+            return generate_latest(registry)
+
+        return generate_latest(REGISTRY)
+
+
+request_metrics = RequestMetrics()
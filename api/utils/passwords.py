@@ -0,0 +1,76 @@
+import os
+from threading import BoundedSemaphore, Lock
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+_pool = None
+_pool_pid = None
+_slots = None
+_pool_lock = Lock()
+
+
+class PasswordQueueFull(RuntimeError):
+    pass
+
+
+def _get_pool():
+    global _pool, _pool_pid, _slots
+
+    # Pools don't survive a fork, so each gunicorn worker starts its own
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=current_app.config['PASSWORD_WORKERS'])
+            _slots = BoundedSemaphore(current_app.config['PASSWORD_QUEUE_LIMIT'])
+            _pool_pid = os.getpid()
+        return _pool, _slots
+
+
+def _run(function, *args):
+    # Hashing holds a CPU for its whole duration, so it runs in the pool and
+    # leaves the request thread free. Past PASSWORD_QUEUE_LIMIT hashes in
+    # flight per worker, callers are turned away instead of queueing up.
+    if not current_app.config['PASSWORD_WORKERS']:
+        return function(*args)
+
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise PasswordQueueFull('too many password checks in progress')
+
+    try:
+        future = pool.submit(function, *args)
+    except Exception:
+        slots.release()
+        raise
+
+    # The slot is held until the hash is done, even if the caller gave up
+    # waiting for it
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        raise PasswordQueueFull('password check timed out')
+
+
+def _method():
+    # werkzeug stores pbkdf2 hashes with their iteration count, so the
+    # configured method is compared in that form
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    if method.startswith('pbkdf2') and method.count(':') == 1:
+        method = f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _method(), current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    # True for hashes made with another algorithm or work factor than the
+    # configured one
+    return password_hash.split('$', 1)[0] != _method()
@@ -0,0 +1,59 @@
+import re
+from bisect import bisect_left
+
+
+class PatchError(ValueError):
+    pass
+
+
+# Characters outside the BMP, which take two UTF-16 code units
+ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def _utf16_offsets(text):
+    # Maps offsets in UTF-16 code units to offsets in code points. Only the
+    # astral characters are looked up, so a BMP-only text maps one to one.
+    starts = [match.start() + number for number, match in enumerate(ASTRAL.finditer(text))]
+
+    def to_code_points(offset):
+        before = bisect_left(starts, offset)
+        if before and starts[before - 1] + 1 == offset:
+            raise PatchError('patch offsets split a surrogate pair')
+        return offset - before
+
+    return to_code_points
+
+
+def apply_patches(text, patches, utf16=False):
+    # Each patch replaces text[start:end] with `text`. Offsets refer to the
+    # original text, so patches must be sorted and must not overlap. They
+    # count code points, or UTF-16 code units when utf16 is set, which is
+    # what editors sending patches from JavaScript strings report.
+    if type(patches) != list:
+        raise PatchError('patches should be a list')
+
+    to_code_points = _utf16_offsets(text) if utf16 and patches else None
+
+    pieces = []
+    position = 0
+    for patch in patches:
+        if type(patch) != dict:
+            raise PatchError('patch should be an object')
+
+        start = patch.get('start', None)
+        end = patch.get('end', start)
+        replacement = patch.get('text', '')
+
+        if type(start) != int or type(end) != int or type(replacement) != str:
+            raise PatchError('patch needs integer start/end and string text')
+        if to_code_points:
+            start, end = to_code_points(start), to_code_points(end)
+        if not (position <= start <= end <= len(text)):
+            raise PatchError('patches out of range or overlapping')
+
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+
+    pieces.append(text[position:])
+    return ''.join(pieces)
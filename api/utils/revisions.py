@@ -0,0 +1,122 @@
+import re
+import json
+import difflib
+from sqlalchemy.orm import undefer
+from api.models import db, DocumentRevision
+from api.utils.patches import apply_patches
+
+
+# Every SNAPSHOT_INTERVAL-th revision keeps its full body, so rebuilding any
+# revision applies at most SNAPSHOT_INTERVAL - 1 deltas
+SNAPSHOT_INTERVAL = 50
+
+# Diffs run over chunks ending at a newline, tag or sentence boundary, which
+# keeps them cheap on HTML bodies that are a single long line
+CHUNK_BOUNDARY = re.compile(r'(?<=[\n>.!?])')
+
+
+def reverse_delta(old, new):
+    # Patches that turn `new` back into `old`, in the format of apply_patches
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if not (old_middle or new_middle):
+        return []
+
+    old_chunks = CHUNK_BOUNDARY.split(old_middle)
+    new_chunks = CHUNK_BOUNDARY.split(new_middle)
+
+    offsets = [prefix]
+    for chunk in new_chunks:
+        offsets.append(offsets[-1] + len(chunk))
+
+    matcher = difflib.SequenceMatcher(None, new_chunks, old_chunks, autojunk=False)
+    return [{
+                'start': offsets[i1],
+                'end': offsets[i2],
+                'text': ''.join(old_chunks[j1:j2])
+            } for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def record_revision(document, previous, editor_id):
+    # `previous` is (revision, title, html_text, plain_text, edited_at) read
+    # before the edit; the document has already been flushed at its new revision
+    revision, title, html_text, plain_text, edited_at = previous
+
+    row = DocumentRevision.query.filter_by(document_id=document.id, revision=revision).first()
+    if row is None:
+        # Documents edited for the first time since history was introduced
+        row = DocumentRevision(document_id=document.id, revision=revision, title=title, created_at=edited_at)
+        db.session.add(row)
+
+    if revision % SNAPSHOT_INTERVAL == 0:
+        row.is_snapshot = True
+        row.html_text = html_text
+        row.plain_text = plain_text
+    else:
+        row.html_text = json.dumps(reverse_delta(html_text, document.html_text))
+        row.plain_text = json.dumps(reverse_delta(plain_text, document.plain_text))
+
+    db.session.add(DocumentRevision(document_id=document.id, revision=document.revision, editor_id=editor_id, title=document.title))
+
+
+def start_history(document, editor_id):
+    db.session.add(DocumentRevision(document_id=document.id, revision=document.revision, editor_id=editor_id, title=document.title))
+
+
+def reconstruct(document, revision):
+    # Returns (row, html_text, plain_text) for the revision, or None if unknown.
+    # `row` is None for a latest revision recorded before history existed.
+    # `document` must have its bodies loaded.
+    # The latest revision may predate history, in which case it has no row
+    if revision == document.revision:
+        row = DocumentRevision.query.filter_by(document_id=document.id, revision=revision).first()
+        return row, document.html_text, document.plain_text
+
+    rows = DocumentRevision.query\
+            .options(undefer(DocumentRevision.html_text), undefer(DocumentRevision.plain_text))\
+            .filter(DocumentRevision.document_id == document.id)\
+            .filter(DocumentRevision.revision.between(revision, revision + SNAPSHOT_INTERVAL))\
+            .order_by(DocumentRevision.revision)\
+            .all()
+
+    if not rows or rows[0].revision != revision:
+        return None
+
+    # Find the nearest full body at or after the revision, then walk back.
+    # Only the row of the document's current revision stands for the current
+    # bodies; any other row without bodies is a gap in the history.
+    for base, row in enumerate(rows):
+        if row.is_snapshot:
+            html_text, plain_text = row.html_text, row.plain_text
+            break
+        if row.revision == document.revision:
+            html_text, plain_text = document.html_text, document.plain_text
+            break
+        if row.html_text is None:
+            return None
+    else:
+        return None
+
+    for row in reversed(rows[:base]):
+        html_text = apply_patches(html_text, json.loads(row.html_text))
+        plain_text = apply_patches(plain_text, json.loads(row.plain_text))
+
+    return rows[0], html_text, plain_text
+
+
+def unified_diff(old, new, old_label, new_label):
+    return ''.join(difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        fromfile=old_label,
+        tofile=new_label
+    ))
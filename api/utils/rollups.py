@@ -0,0 +1,75 @@
+import click
+from collections import Counter
+from flask.cli import AppGroup
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from api.models import db, Visit, DailyVisitRollup
+
+
+rollups_cli = AppGroup('rollups', help='Maintain the visit rollup tables.')
+
+
+def _upsert(model, target, counts):
+    if not counts:
+        return
+
+    # Rows go in conflict key order, so concurrent flushes from other workers
+    # lock existing rollup rows in the same order and can't deadlock
+    column = getattr(model, target)
+    statement = insert(model.__table__).values([
+        { target: target_id, 'bucket': bucket, 'count': count }
+        for (target_id, bucket), count in sorted(counts.items())
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[target, 'bucket'],
+        index_where=column.isnot(None),
+        set_={ 'count': model.__table__.c['count'] + statement.excluded['count'] }
+    )
+    db.session.execute(statement)
+
+
+def increment_rollups(rows):
+    # Called with the visit rows of a write, inside the same transaction
+    daily = { 'url_id': Counter(), 'document_id': Counter() }
+
+    for row in rows:
+        for target in ('url_id', 'document_id'):
+            if row[target]:
+                daily[target][(row[target], row['time'].date())] += 1
+
+    for target in ('url_id', 'document_id'):
+        _upsert(DailyVisitRollup, target, daily[target])
+
+
+def _rebuild(model, bucket):
+    db.session.query(model).delete(synchronize_session=False)
+
+    for target in ('url_id', 'document_id'):
+        column = getattr(Visit, target)
+        grouped = select(column, bucket, func.count())\
+                    .where(column.isnot(None))\
+                    .group_by(column, bucket)
+        db.session.execute(model.__table__.insert().from_select([target, 'bucket', 'count'], grouped))
+
+
+def rebuild_rollups():
+    # Hold off concurrent visit inserts so no visit is counted twice or missed
+    db.session.execute(text('LOCK TABLE visits IN SHARE MODE'))
+    _rebuild(DailyVisitRollup, func.date(Visit.time))
+
+
+@rollups_cli.command('backfill')
+def backfill_rollups():
+    """Rebuild the daily rollups from the visits table."""
+    try:
+        rebuild_rollups()
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    finally:
+        db.session.close()
+
+    click.echo('visit rollups rebuilt')
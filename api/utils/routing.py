@@ -0,0 +1,134 @@
+import time
+import itertools
+from functools import wraps
+from threading import Lock
+from flask import current_app, g, request, has_app_context, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm, text
+
+
+# Set on responses to writes; while it lasts, reads go to the primary
+WROTE_COOKIE = 'urrl_wrote'
+
+
+class ReplicaRouter:
+    # Picks a replica bind for read-only requests. Replicas are tried
+    # round-robin and skipped while they are more than REPLICA_MAX_LAG_BYTES
+    # of WAL behind the primary or can't be reached; with none usable, reads
+    # stay on the primary. A request keeps the replica it was given, and a
+    # client that just wrote reads from the primary for REPLICA_AFTER_WRITE
+    # seconds, so it sees its own writes.
+
+    def __init__(self):
+        self.binds = []
+        self.max_lag = 16 * 1024 * 1024
+        self.check_interval = 10
+        self.after_write = 30
+        self._health = {}
+        self._rotation = itertools.count()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.binds = sorted(bind for bind in (app.config.get('SQLALCHEMY_BINDS') or {}) if bind.startswith('replica'))
+        self.max_lag = app.config['REPLICA_MAX_LAG_BYTES']
+        self.check_interval = app.config['REPLICA_CHECK_INTERVAL']
+        self.after_write = app.config['REPLICA_AFTER_WRITE']
+        app.after_request(self._remember_write)
+
+    def _lag(self, engine, primary):
+        if engine.dialect.name != 'postgresql':
+            return 0
+
+        with engine.connect() as connection:
+            # NULL on a server that isn't replaying WAL, i.e. not a replica
+            replayed = connection.execute(text("SELECT pg_last_wal_replay_lsn()::text")).scalar()
+        if replayed is None:
+            return 0
+
+        # Positions in the WAL rather than replay timestamps, which fall
+        # behind on an idle primary and depend on both clocks agreeing
+        with primary.connect() as connection:
+            lag = connection.execute(text(
+                "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), CAST(:replayed AS pg_lsn))"
+            ), { 'replayed': replayed }).scalar()
+        return max(0, int(lag))
+
+    def _healthy(self, bind, engine, primary):
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(bind, (None, False))
+
+        if checked_at is None or now - checked_at > self.check_interval:
+            try:
+                healthy = self._lag(engine, primary) <= self.max_lag
+            except Exception:
+                current_app.logger.warning('replica %s unavailable', bind, exc_info=True)
+                healthy = False
+            with self._lock:
+                self._health[bind] = (now, healthy)
+
+        return healthy
+
+    def choose(self, db):
+        if not self.binds:
+            return None
+
+        primary = db.get_engine()
+        start = next(self._rotation)
+        for offset in range(len(self.binds)):
+            bind = self.binds[(start + offset) % len(self.binds)]
+            engine = db.get_engine(bind=bind)
+            if self._healthy(bind, engine, primary):
+                return engine
+        return None
+
+    def engine(self, db):
+        # Chosen once per request, so all of its reads see the same replica
+        if 'replica' not in g:
+            g.replica = None if wrote_recently() else self.choose(db)
+        return g.replica
+
+    def _remember_write(self, response):
+        if self.binds and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            config = current_app.config
+            response.set_cookie(WROTE_COOKIE, '1', max_age=self.after_write, httponly=True,
+                                secure=config['JWT_COOKIE_SECURE'], samesite=config['JWT_COOKIE_SAMESITE'])
+        return response
+
+
+replica_router = ReplicaRouter()
+
+
+def read_only(view):
+    # Lets the session send this request's queries to a replica
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def wrote_recently():
+    # Whether this client wrote in the last REPLICA_AFTER_WRITE seconds, so its
+    # reads stay on the primary
+    return has_request_context() and request.cookies.get(WROTE_COOKIE) is not None
+
+
+def on_replica():
+    # Whether this request's reads went to a replica, and so may be stale
+    return has_app_context() and g.get('replica') is not None
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context() and g.get('read_only') and not self._flushing:
+            engine = replica_router.engine(self.app.extensions['sqlalchemy'].db)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,155 @@
+import re
+import math
+from collections import Counter
+from sqlalchemy import func, case, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from api.models import db, Document, SearchTerm, SearchPosting, SearchDocument, document_shared_users
+from api.utils.cache import TTLCache
+
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TITLE_WEIGHT = 3
+MAX_TERM_LENGTH = 64
+MAX_PREFIX_EXPANSIONS = 50
+
+TOKEN = re.compile(r'\w+')
+QUERY_TOKEN = re.compile(r'\w+\*?')
+
+# Document count and average length change slowly, so ranking reads them
+# from a per-worker copy instead of counting on every query
+_corpus = TTLCache(maxsize=1, ttl=60)
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN.findall(text.lower()) if len(token) > 1]
+
+
+def term_frequencies(title, plain_text):
+    frequencies = Counter(tokenize(plain_text))
+    for term in tokenize(title):
+        frequencies[term] += TITLE_WEIGHT
+    return frequencies
+
+
+def _bump_document_counts(terms, delta):
+    if not terms:
+        return
+
+    statement = insert(SearchTerm.__table__).values([{ 'term': term, 'document_count': max(delta, 0) } for term in terms])
+    statement = statement.on_conflict_do_update(
+        index_elements=['term'],
+        set_={ 'document_count': SearchTerm.__table__.c.document_count + delta }
+    )
+    db.session.execute(statement)
+
+
+def index_document(document_id, title, plain_text):
+    # Brings the postings of one document in line with its current text,
+    # touching only the terms whose frequency changed
+    frequencies = term_frequencies(title, plain_text)
+    existing = dict(db.session.query(SearchPosting.term, SearchPosting.frequency)
+                    .filter(SearchPosting.document_id == document_id))
+
+    removed = [term for term in existing if term not in frequencies]
+    added = [term for term in frequencies if term not in existing]
+    changed = [term for term in frequencies if term in existing and existing[term] != frequencies[term]]
+
+    if removed:
+        db.session.query(SearchPosting)\
+            .filter(SearchPosting.document_id == document_id, SearchPosting.term.in_(removed))\
+            .delete(synchronize_session=False)
+    if added:
+        db.session.execute(SearchPosting.__table__.insert().values([
+            { 'term': term, 'document_id': document_id, 'frequency': frequencies[term] } for term in added
+        ]))
+    for term in changed:
+        db.session.query(SearchPosting)\
+            .filter(SearchPosting.document_id == document_id, SearchPosting.term == term)\
+            .update({ 'frequency': frequencies[term] }, synchronize_session=False)
+
+    _bump_document_counts(sorted(added), 1)
+    _bump_document_counts(sorted(removed), -1)
+
+    statement = insert(SearchDocument.__table__).values(document_id=document_id, length=sum(frequencies.values()))
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['document_id'],
+        set_={ 'length': statement.excluded['length'] }
+    ))
+
+
+def unindex_document(document_id):
+    terms = [term for (term,) in db.session.query(SearchPosting.term).filter(SearchPosting.document_id == document_id)]
+    _bump_document_counts(sorted(terms), -1)
+    db.session.query(SearchPosting).filter(SearchPosting.document_id == document_id).delete(synchronize_session=False)
+    db.session.query(SearchDocument).filter(SearchDocument.document_id == document_id).delete(synchronize_session=False)
+
+
+def _corpus_stats():
+    stats = _corpus.get('corpus')
+    if stats is None:
+        count, average = db.session.query(func.count(SearchDocument.document_id), func.avg(SearchDocument.length)).one()
+        stats = (count, float(average or 0))
+        _corpus.set('corpus', stats)
+    return stats
+
+
+def _expand(tokens):
+    # term -> document_count for every exact term and prefix expansion in the query
+    exact = [token for token in tokens if not token.endswith('*')]
+    prefixes = [token[:-1] for token in tokens if token.endswith('*')]
+
+    terms = dict(db.session.query(SearchTerm.term, SearchTerm.document_count)
+                .filter(SearchTerm.term.in_(exact), SearchTerm.document_count > 0))
+
+    for prefix in prefixes:
+        terms.update(db.session.query(SearchTerm.term, SearchTerm.document_count)
+                    .filter(SearchTerm.term.like(prefix.replace('_', '\\_') + '%'), SearchTerm.document_count > 0)
+                    .order_by(SearchTerm.document_count.desc())
+                    .limit(MAX_PREFIX_EXPANSIONS))
+
+    return terms
+
+
+def visible_documents(user_id, scope):
+    owned = Document.user_id == user_id
+    shared = Document.id.in_(select(document_shared_users.c.document_id).where(document_shared_users.c.user_id == user_id))
+
+    if scope == 'owned':
+        return owned
+    if scope == 'shared':
+        return shared
+    return or_(owned, shared)
+
+
+def search_documents(user_id, query, limit, scope=None):
+    # Returns [(document id, title, snippet, score)] ranked by BM25
+    tokens = [token[:MAX_TERM_LENGTH] for token in QUERY_TOKEN.findall(query.lower())]
+    terms = _expand(tokens)
+    if not terms:
+        return []
+
+    count, average_length = _corpus_stats()
+    count = max(count, max(terms.values()))
+    idf = { term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in terms.items() }
+
+    frequency = SearchPosting.frequency
+    length_norm = 1 - B + B * SearchDocument.length / (average_length or 1)
+    score = func.sum(case(idf, value=SearchPosting.term, else_=0) * frequency * (K1 + 1) / (frequency + K1 * length_norm)).label('score')
+
+    ranked = db.session.query(SearchPosting.document_id, score)\
+                .join(SearchDocument, SearchDocument.document_id == SearchPosting.document_id)\
+                .join(Document, Document.id == SearchPosting.document_id)\
+                .filter(SearchPosting.term.in_(list(terms)))\
+                .filter(visible_documents(user_id, scope))\
+                .group_by(SearchPosting.document_id)\
+                .order_by(score.desc())\
+                .limit(limit)\
+                .subquery()
+
+    return db.session.query(Document.id, Document.title, Document.snippet, ranked.c.score)\
+            .join(ranked, ranked.c.document_id == Document.id)\
+            .order_by(ranked.c.score.desc())\
+            .all()
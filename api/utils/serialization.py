@@ -0,0 +1,82 @@
+import uuid
+import decimal
+import dataclasses
+from datetime import date
+from flask import current_app, json
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+ENCODERS = ('orjson', 'stdlib')
+
+
+def _default(o):
+    # Same conversions as Flask's JSONEncoder, so both encoders write the
+    # same documents: dates as HTTP dates, decimals and uuids as strings
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class JSONProvider:
+    # Builds the JSON responses of every route. With orjson installed the
+    # body is encoded by it, otherwise, or for values orjson can't encode
+    # (integers past 64 bits), Flask's own jsonify is used.
+
+    def __init__(self):
+        self.encoder = 'stdlib'
+
+    def init_app(self, app):
+        encoder = app.config['JSON_ENCODER']
+        if encoder not in ENCODERS:
+            raise ValueError(f"JSON_ENCODER must be one of {', '.join(ENCODERS)}")
+
+        if encoder == 'orjson' and orjson is None:
+            app.logger.warning('orjson is not installed, falling back to the stdlib JSON encoder')
+            encoder = 'stdlib'
+
+        self.encoder = encoder
+        app.extensions['json_provider'] = self
+
+    def dumps(self, obj, sort_keys=False, indent=False):
+        # Tuples come out as arrays. Datetimes are passed through to _default.
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def response(self, *args, **kwargs):
+        if self.encoder == 'stdlib':
+            return json.jsonify(*args, **kwargs)
+
+        if args and kwargs:
+            raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+        data = args[0] if len(args) == 1 else args or kwargs
+
+        # Flask pretty prints in debug mode and sorts keys unless told not to
+        app = current_app
+        try:
+            body = self.dumps(data, app.config['JSON_SORT_KEYS'], app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug)
+        except TypeError:
+            return json.jsonify(*args, **kwargs)
+
+        return app.response_class(body + b'\n', mimetype=app.config['JSONIFY_MIMETYPE'])
+
+
+json_provider = JSONProvider()
+
+
+def jsonify(*args, **kwargs):
+    return json_provider.response(*args, **kwargs)
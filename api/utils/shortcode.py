@@ -0,0 +1,67 @@
+import os
+import string
+from threading import Lock
+from sqlalchemy import select
+from api.models import db, short_code_sequence
+
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 7
+KEYSPACE = len(ALPHABET) ** CODE_LENGTH
+
+# Prime, so coprime with 62**7 and the affine map below is a bijection
+MULTIPLIER = 2176477521763
+OFFSET = 1234567890123
+
+
+def encode(number):
+    # Bijective on [0, KEYSPACE): affine scramble, then each base62 digit is
+    # shifted by the one before it so neighbouring numbers differ everywhere
+    number = (number * MULTIPLIER + OFFSET) % KEYSPACE
+
+    digits = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(ALPHABET))
+        digits.append(digit)
+
+    previous = 0
+    for i, digit in enumerate(digits):
+        previous = (digit + previous) % len(ALPHABET)
+        digits[i] = previous
+
+    return ''.join(ALPHABET[digit] for digit in digits)
+
+
+class ShortCodeAllocator:
+    # Hands out codes from blocks of `short_code_seq`. The sequence advances
+    # by BLOCK_SIZE, so each nextval leases a whole block to this process and
+    # no two workers can ever encode the same number.
+
+    def __init__(self):
+        self._next = 0
+        self._end = 0
+        self._pid = None
+        self._lock = Lock()
+
+    def _lease(self):
+        start = db.session.execute(select(short_code_sequence.next_value())).scalar()
+        self._next = start
+        self._end = start + short_code_sequence.increment
+        self._pid = os.getpid()
+
+    def next_code(self):
+        with self._lock:
+            # A block leased before a fork would be shared with the children
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._lease()
+
+            number = self._next
+            self._next += 1
+
+        if number >= KEYSPACE:
+            raise RuntimeError('short code keyspace exhausted')
+
+        return encode(number)
+
+
+short_code_allocator = ShortCodeAllocator()
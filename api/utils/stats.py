@@ -1,61 +1,105 @@
-from datetime import date
-
-url_pie = [
-    { 'x': 'urrl.link/a7uWohd', 'y': 4, 'text': '1%' },
-    { 'x': 'urrl.link/Ikso2b4', 'y': 76, 'text': '19%' },
-    { 'x': 'urrl.link/nd47SAw', 'y': 100, 'text': '25%' },
-    { 'x': 'urrl.link/9os3bfe', 'y': 210, 'text': '52.5%' },
-    { 'x': 'urrl.link/5gv3bfe', 'y': 10, 'text': '2.5%' }
-]
-document_pie = [
-    { 'x': 'Planning proposal', 'y': 10, 'text': '3.6%' },
-    { 'x': 'June Monthly review', 'y': 5, 'text': '1.8%' },
-    { 'x': 'Coding Material', 'y': 80, 'text': '29.1%' },
-    { 'x': 'My Resume', 'y': 150, 'text': '54.5%' },
-    { 'x': 'Cover Letter', 'y': 30, 'text': '10.9%' }
-]
-stacked = [
-    [
-    { 'x': 'Jan', 'y': 111.1 },
-    { 'x': 'Feb', 'y': 127.3 },
-    { 'x': 'Mar', 'y': 143.4 },
-    { 'x': 'Apr', 'y': 159.9 },
-    { 'x': 'May', 'y': 159.9 },
-    { 'x': 'Jun', 'y': 159.9 },
-    { 'x': 'July', 'y': 159.9 }
-    ],
-    [
-    { 'x': 'Jan', 'y': 111.1 },
-    { 'x': 'Feb', 'y': 127.3 },
-    { 'x': 'Mar', 'y': 143.4 },
-    { 'x': 'Apr', 'y': 159.9 },
-    { 'x': 'May', 'y': 159.9 },
-    { 'x': 'Jun', 'y': 159.9 },
-    { 'x': 'July', 'y': 159.9 }
-    ]
-]
-
-line = [
-[
-    { 'x': (2021, 11, 1), 'y': 0 },
-    { 'x': (2021, 12, 1), 'y': 0 },
-    { 'x': (2022, 1, 1), 'y': 0 },
-    { 'x': (2022, 2, 1), 'y': 0 },
-    { 'x': (2022, 3, 1), 'y': 36 },
-    { 'x': (2022, 4, 1), 'y': 38 },
-    { 'x': (2022, 5, 1), 'y': 54 },
-    { 'x': (2022, 6, 1), 'y': 57 },
-    { 'x': (2022, 7, 1), 'y': 70 }
-],
-[
-    { 'x': (2021, 11, 1), 'y': 0 },
-    { 'x': (2021, 12, 1), 'y': 0 },
-    { 'x': (2022, 1, 1), 'y': 0 },
-    { 'x': (2022, 2, 1), 'y': 0 },
-    { 'x': (2022, 3, 1), 'y': 30 },
-    { 'x': (2022, 4, 1), 'y': 39 },
-    { 'x': (2022, 5, 1), 'y': 50 },
-    { 'x': (2022, 6, 1), 'y': 70 },
-    { 'x': (2022, 7, 1), 'y': 100 }
-]
-]
\ No newline at end of file
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from api.models import db, GlobalStats
+from api.utils.analytics import global_url_top_stats, global_document_top_stats, global_monthly_url_visits, global_monthly_document_visits, stacked_series, line_series
+
+
+# Key of the advisory lock held while the global_stats row is recomputed
+STATS_LOCK = 0x57a75
+
+
+class StatsSnapshot:
+    # Platform-wide statistics for /api/v1/stats, kept in the global_stats
+    # table. Each worker loads the row before its first stats response and a
+    # background thread reloads it every `interval` seconds. The first worker
+    # to find it older than that recomputes it from the daily rollups while
+    # the others keep serving the row they have, so responses are at most two
+    # intervals old and the rollups are aggregated once per interval.
+
+    def __init__(self):
+        self.app = None
+        self.interval = 300
+        self.snapshot = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config['STATS_REFRESH_INTERVAL']
+
+    def get(self):
+        if self.snapshot is None:
+            with self._lock:
+                if self.snapshot is None:
+                    self.load()
+        self._ensure_refresher()
+        return self.snapshot
+
+    def load(self):
+        with self.app.app_context():
+            try:
+                row = GlobalStats.query.get(1)
+                if row is None or row.generated_at < datetime.utcnow() - timedelta(seconds=self.interval):
+                    # Without a row there is nothing to serve, so wait for
+                    # whoever is computing it
+                    row = self._refresh(wait=row is None) or row
+                self.snapshot = dict(row.payload, generated_at=row.generated_at)
+            finally:
+                db.session.remove()
+
+    def _refresh(self, wait):
+        lock = func.pg_advisory_xact_lock(STATS_LOCK) if wait else func.pg_try_advisory_xact_lock(STATS_LOCK)
+        if db.session.execute(select(lock)).scalar() is False:
+            db.session.rollback()
+            return None
+
+        # Someone else may have refreshed it while we waited for the lock
+        row = GlobalStats.query.populate_existing().get(1)
+        if row is not None and row.generated_at >= datetime.utcnow() - timedelta(seconds=self.interval):
+            db.session.commit()
+            return row
+
+        url_grouped = global_monthly_url_visits()
+        document_grouped = global_monthly_document_visits()
+        payload = {
+            'url_pie': global_url_top_stats(),
+            'document_pie': global_document_top_stats(),
+            'stacked': [stacked_series(url_grouped), stacked_series(document_grouped)],
+            'line': [line_series(url_grouped), line_series(document_grouped)]
+        }
+
+        statement = insert(GlobalStats).values(id=1, payload=payload, generated_at=datetime.utcnow())
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[GlobalStats.id],
+            set_={ 'payload': statement.excluded.payload, 'generated_at': statement.excluded.generated_at }
+        ))
+        db.session.commit()
+        return GlobalStats.query.populate_existing().get(1)
+
+    def _ensure_refresher(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+
+            self._thread = threading.Thread(target=self._run, name='stats-refresher', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.load()
+            except Exception:
+                self.app.logger.exception('failed to refresh global stats')
+
+
+stats_snapshot = StatsSnapshot()
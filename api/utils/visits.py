@@ -0,0 +1,209 @@
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError, OperationalError
+from api.models import db, Url, Document, Visit, get_uuid
+from api.utils.rollups import increment_rollups
+from api.utils.analytics import invalidate_visited
+
+
+_STOP = object()
+
+# Times a batch is tried while the database can't be reached, waiting
+# FLUSH_RETRY_DELAY seconds longer after each failure
+FLUSH_ATTEMPTS = 3
+FLUSH_RETRY_DELAY = 1
+
+
+class VisitRecorder:
+    # Collects visit events from request handlers and writes them in bulk.
+    #
+    # In 'async' mode events go onto a bounded queue drained by a background
+    # thread, which flushes every `batch_size` events or `flush_interval`
+    # seconds with a single multi-row INSERT. When the queue is full the
+    # request blocks for up to `enqueue_timeout` and then writes its visit
+    # synchronously, so bursts slow down instead of dropping visits.
+    # In 'sync' mode every visit is committed inside the request, as before.
+
+    def __init__(self):
+        self.app = None
+        self.mode = 'sync'
+        self.batch_size = 500
+        self.flush_interval = 0.5
+        self.enqueue_timeout = 0.05
+        self.queue_size = 10000
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.mode = app.config['VISIT_RECORDING_MODE']
+        self.batch_size = app.config['VISIT_BATCH_SIZE']
+        self.flush_interval = app.config['VISIT_FLUSH_INTERVAL_MS'] / 1000
+        self.enqueue_timeout = app.config['VISIT_ENQUEUE_TIMEOUT_MS'] / 1000
+        self.queue_size = app.config['VISIT_QUEUE_SIZE']
+        atexit.register(self.shutdown)
+
+    def record(self, url_id=None, document_id=None):
+        row = self._row(url_id, document_id)
+
+        if self.mode == 'async':
+            self._ensure_worker()
+            try:
+                self._queue.put(row, timeout=self.enqueue_timeout)
+                return
+            except queue.Full:
+                pass
+
+        self._write([row])
+
+    def try_record(self, url_id=None, document_id=None):
+        # Queues a visit without ever blocking. Returns False when it couldn't
+        # (sync mode or a full queue), leaving the caller to record() it elsewhere
+        if self.mode != 'async':
+            return False
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(self._row(url_id, document_id))
+            return True
+        except queue.Full:
+            return False
+
+    def shutdown(self, timeout=5):
+        worker = self._worker
+        if not (worker and worker.is_alive() and self._pid == os.getpid()):
+            return
+
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        worker.join(timeout)
+
+    def _row(self, url_id, document_id):
+        return {
+            'id': get_uuid(),
+            'url_id': url_id,
+            'document_id': document_id,
+            'time': datetime.utcnow()
+        }
+
+    def _ensure_worker(self):
+        # Workers are forked from the master, so the thread is started lazily
+        # in each process that actually records visits
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive():
+                return
+
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._worker = threading.Thread(target=self._run, name='visit-recorder', daemon=True)
+            self._pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        pending = []
+        deadline = None
+
+        while True:
+            timeout = max(0, deadline - time.monotonic()) if pending else None
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                row = None
+
+            if row is _STOP:
+                if pending:
+                    self._flush(pending)
+                return
+
+            if row is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.append(row)
+
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(pending)
+                pending = []
+
+    def _flush(self, rows):
+        with self.app.app_context():
+            try:
+                written = self._write_batch(rows)
+                # Per batch only; visits written synchronously rely on the cache TTL
+                invalidate_visited(written)
+            except Exception:
+                self.app.logger.exception('failed to flush %d visits', len(rows))
+            finally:
+                db.session.remove()
+
+    def _write_batch(self, rows):
+        # A visit whose url or document is gone can't be stored, but mustn't
+        # take the rest of the batch down with it, and neither may a brief
+        # outage. Returns the rows that were written.
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                return self._write(self._existing(rows))
+            except IntegrityError:
+                # Deleted after _existing looked, or the batch was committed
+                # by an attempt whose connection dropped before it heard back
+                return self._write_each(rows)
+            except OperationalError:
+                if attempt == FLUSH_ATTEMPTS:
+                    raise
+                self.app.logger.warning('failed to flush %d visits, retrying', len(rows), exc_info=True)
+                db.session.remove()
+                time.sleep(FLUSH_RETRY_DELAY * attempt)
+
+    def _existing(self, rows):
+        url_ids = { row['url_id'] for row in rows if row['url_id'] }
+        document_ids = { row['document_id'] for row in rows if row['document_id'] }
+
+        urls = { id for (id,) in db.session.query(Url.id).filter(Url.id.in_(url_ids)) } if url_ids else set()
+        documents = { id for (id,) in db.session.query(Document.id).filter(Document.id.in_(document_ids)) } if document_ids else set()
+
+        return [row for row in rows if (row['url_id'] in urls if row['url_id'] else row['document_id'] in documents)]
+
+    def _write_each(self, rows):
+        written = []
+        try:
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(Visit.__table__.insert().values([row]))
+                        increment_rollups([row])
+                    written.append(row)
+                except IntegrityError:
+                    pass
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if len(written) < len(rows):
+            self.app.logger.warning('dropped %d of %d visits that could not be stored', len(rows) - len(written), len(rows))
+        return written
+
+    def _write(self, rows):
+        if not rows:
+            return rows
+
+        try:
+            db.session.execute(Visit.__table__.insert().values(rows))
+            increment_rollups(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return rows
+
+
+visit_recorder = VisitRecorder()
@@ -0,0 +1,258 @@
+import time
+import json
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, quote
+from api import create_app
+from api.models import db, User, Url, Document
+from benchmarks.report import summarize, print_table, save_results, load_results, print_comparison
+from benchmarks.synth import PASSWORD, EMAIL_DOMAIN
+
+
+# Replays a mixed workload against the app and reports throughput and
+# latency percentiles per endpoint, e.g.
+#
+#   python -m benchmarks.driver --mode inprocess --requests 20000
+#   python -m benchmarks.driver --mode http --base-url http://127.0.0.1:8000 --compare benchmarks/results/<earlier>.json
+#
+# Aliases, documents and users are sampled from the configured database, so
+# run benchmarks.synth first. Both modes use it; http mode only reads it.
+
+DEFAULT_MIX = 'get_url=70,get_document=15,create_url=10,get_user_stats=5'
+SAMPLE_SIZE = 5000
+LOGIN_ATTEMPTS = 10
+
+
+class InProcessClient:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def login(self, email, password):
+        response = self.client.post('/api/v1/auth/login', json={ 'email': email, 'password': password })
+        # Cookies may be marked Secure, which the test client won't send over http
+        for cookie in response.headers.getlist('Set-Cookie'):
+            name, value = cookie.split(';', 1)[0].split('=', 1)
+            self.client.set_cookie('localhost', name, value)
+        return response.status_code
+
+    def request(self, method, path, body=None):
+        return self.client.open(path, method=method, json=body).status_code
+
+
+class HttpClient:
+
+    def __init__(self, base_url):
+        target = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = target.netloc
+        self.prefix = target.path.rstrip('/')
+        self.cookies = {}
+        self.connection = self.connection_class(self.netloc, timeout=30)
+
+    def login(self, email, password):
+        status, response = self._send('POST', '/api/v1/auth/login', { 'email': email, 'password': password })
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            name, value = cookie.split(';', 1)[0].split('=', 1)
+            self.cookies[name] = value
+        return status
+
+    def request(self, method, path, body=None):
+        return self._send(method, path, body)[0]
+
+    def _send(self, method, path, body):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = self.connection_class(self.netloc, timeout=30)
+            raise
+        return response.status, response
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown endpoint '{name.strip()}', expected one of {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def sample_targets(app, rng):
+    with app.app_context():
+        try:
+            emails = [email for (email,) in db.session.query(User.email)
+                        .filter(User.email.like(f"%@{EMAIL_DOMAIN}"))
+                        .limit(SAMPLE_SIZE)]
+            aliases = [short_url.split('/', 1)[1] for (short_url,) in db.session.query(Url.short_url)
+                        .filter(Url.is_private == False)
+                        .order_by(Url.id)
+                        .limit(SAMPLE_SIZE)]
+            # Public documents, so every sampled user may read them
+            documents = [id for (id,) in db.session.query(Document.id)
+                        .filter(Document.is_private == False)
+                        .order_by(Document.id)
+                        .limit(SAMPLE_SIZE)]
+        finally:
+            db.session.close()
+
+    if not (emails and aliases and documents):
+        raise SystemExit('no benchmark data found, run python -m benchmarks.synth first')
+
+    rng.shuffle(aliases)
+    return { 'emails': emails, 'aliases': aliases, 'documents': documents }
+
+
+def get_url(client, rng, targets):
+    return client.request('GET', f"/api/v1/url/visit/?alias={quote(rng.choice(targets['aliases']))}")
+
+
+def get_document(client, rng, targets):
+    return client.request('GET', f"/api/v1/document/id/{rng.choice(targets['documents'])}")
+
+
+def create_url(client, rng, targets):
+    return client.request('POST', '/api/v1/url/create', { 'long_url': f"https://bench.example.com/{rng.getrandbits(64):x}" })
+
+
+def get_user_stats(client, rng, targets):
+    return client.request('GET', '/api/v1/user/stats')
+
+
+def login(client, rng, targets):
+    return client.login(rng.choice(targets['emails']), PASSWORD)
+
+
+OPERATIONS = {
+    'get_url': get_url,
+    'get_document': get_document,
+    'create_url': create_url,
+    'get_user_stats': get_user_stats,
+    'login': login
+}
+
+# Operations that don't need the worker to be signed in
+ANONYMOUS = {'get_url', 'login'}
+
+
+def run(make_client, targets, weights, requests, concurrency, seed):
+    names = list(weights)
+    latencies = { name: [] for name in names }
+    errors = { name: 0 for name in names }
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+    failures = []
+
+    def worker(number):
+        rng = random.Random(seed + number)
+        client = make_client()
+        # Without a session every authenticated request would just count as
+        # an error, so the run stops instead. A busy password pool answers
+        # 503 with Retry-After, which is waited out.
+        if set(names) - ANONYMOUS:
+            email = rng.choice(targets['emails'])
+            for _ in range(LOGIN_ATTEMPTS):
+                status = client.login(email, PASSWORD)
+                if status != 503:
+                    break
+                time.sleep(1)
+            if status != 200:
+                with lock:
+                    failures.append(f"login as {email} returned {status}")
+                return
+
+        own_latencies = { name: [] for name in names }
+        own_errors = { name: 0 for name in names }
+
+        while True:
+            with lock:
+                if failures or next(remaining, None) is None:
+                    break
+
+            name = rng.choices(names, weights=[weights[name] for name in names])[0]
+            started = time.perf_counter()
+            try:
+                status = OPERATIONS[name](client, rng, targets)
+            except (OSError, http.client.HTTPException):
+                own_errors[name] += 1
+                continue
+            own_latencies[name].append(time.perf_counter() - started)
+            if status >= 400:
+                own_errors[name] += 1
+
+        with lock:
+            for name in names:
+                latencies[name].extend(own_latencies[name])
+                errors[name] += own_errors[name]
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if failures:
+        raise SystemExit(failures[0])
+
+    results = { name: summarize(latencies[name], elapsed, errors[name]) for name in names }
+    results['total'] = summarize([latency for name in names for latency in latencies[name]], elapsed, sum(errors.values()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a mixed workload against the app')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='app to load in http mode')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight pairs')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='where to save the results, defaults to benchmarks/results/')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    weights = parse_mix(args.mix)
+    app = create_app()
+    targets = sample_targets(app, random.Random(args.seed))
+
+    if args.mode == 'inprocess':
+        make_client = lambda: InProcessClient(app)
+    else:
+        make_client = lambda: HttpClient(args.base_url)
+
+    if args.warmup:
+        run(make_client, targets, weights, args.warmup, args.concurrency, args.seed)
+    results = run(make_client, targets, weights, args.requests, args.concurrency, args.seed)
+
+    print_table(results)
+    path = save_results(f"driver-{args.mode}", results, {
+        'mode': args.mode,
+        'mix': weights,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'seed': args.seed
+    }, args.output)
+    print(f"saved {path}")
+
+    if args.compare:
+        print_comparison(load_results(args.compare), results)
+
+
+if __name__ == '__main__':
+    main()
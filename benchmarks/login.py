@@ -0,0 +1,70 @@
+import random
+import argparse
+import threading
+from api import create_app
+from benchmarks.driver import InProcessClient, HttpClient, sample_targets, run
+from benchmarks.report import print_table, save_results
+
+
+# Measures login throughput and what a login burst does to redirects:
+# get_url runs alone first, then again while logins run next to it, e.g.
+#
+#   python -m benchmarks.login --mode http --base-url http://127.0.0.1:8000
+#
+# Compare a server started with PASSWORD_WORKERS=0 (hashing on the request
+# thread) against one using the pool.
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark logins under redirect load')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='app to load in http mode')
+    parser.add_argument('--redirect-requests', type=int, default=5000)
+    parser.add_argument('--redirect-concurrency', type=int, default=16)
+    parser.add_argument('--login-requests', type=int, default=200)
+    parser.add_argument('--login-concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='where to save the results, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    app = create_app()
+    targets = sample_targets(app, random.Random(args.seed))
+
+    if args.mode == 'inprocess':
+        make_client = lambda: InProcessClient(app)
+    else:
+        make_client = lambda: HttpClient(args.base_url)
+
+    redirects = lambda: run(make_client, targets, { 'get_url': 1 }, args.redirect_requests, args.redirect_concurrency, args.seed)
+
+    alone = redirects()['get_url']
+
+    during = {}
+    background = threading.Thread(target=lambda: during.update(redirects()))
+    background.start()
+    logins = run(make_client, targets, { 'login': 1 }, args.login_requests, args.login_concurrency, args.seed + 1000)['login']
+    background.join()
+
+    # A rejected login never checks a hash, so its timings say nothing
+    if logins['errors']:
+        raise SystemExit(f"{logins['errors']} of {args.login_requests} logins failed")
+
+    results = {
+        'get_url alone': alone,
+        'get_url with logins': during['get_url'],
+        'login': logins
+    }
+
+    print_table(results)
+    path = save_results(f"login-{args.mode}", results, {
+        'mode': args.mode,
+        'redirect_requests': args.redirect_requests,
+        'redirect_concurrency': args.redirect_concurrency,
+        'login_requests': args.login_requests,
+        'login_concurrency': args.login_concurrency
+    }, args.output)
+    print(f"saved {path}")
+
+
+if __name__ == '__main__':
+    main()
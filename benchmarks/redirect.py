@@ -0,0 +1,95 @@
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, quote
+from benchmarks.report import summarize, print_table, save_results
+
+
+# Compares the redirect server against the /api/v1/url/visit/ route of the
+# main app. Start both first, e.g.
+#
+#   gunicorn app:app --workers 4 --bind :8000
+#   uvicorn redirect:application --workers 4 --port 8001
+#   python -m benchmarks.redirect --aliases abc1234,xyz9876
+#
+# Both targets are hit with the same aliases, request count and concurrency.
+
+
+def load(base_url, paths, requests, concurrency):
+    target = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def worker():
+        connection = connection_class(target.netloc, timeout=10)
+        own_latencies = []
+        own_errors = 0
+
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+
+            path = target.path.rstrip('/') + random.choice(paths)
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = connection_class(target.netloc, timeout=10)
+                continue
+            own_latencies.append(time.perf_counter() - started)
+
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test short link resolution')
+    parser.add_argument('--aliases', required=True, help='comma separated aliases that exist in the database')
+    parser.add_argument('--flask', default='http://127.0.0.1:8000', help='base url of the main app')
+    parser.add_argument('--redirect', default='http://127.0.0.1:8001', help='base url of the redirect server')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=500)
+    args = parser.parse_args()
+
+    aliases = [alias.strip() for alias in args.aliases.split(',') if alias.strip()]
+    targets = {
+        'flask /url/visit/': (args.flask, [f'/api/v1/url/visit/?alias={quote(alias)}' for alias in aliases]),
+        'redirect server': (args.redirect, [f'/{quote(alias)}' for alias in aliases])
+    }
+
+    results = {}
+    for name, (base_url, paths) in targets.items():
+        # Fills the alias caches so both sides are measured warm
+        load(base_url, paths, args.warmup, args.concurrency)
+        results[name] = load(base_url, paths, args.requests, args.concurrency)
+
+    print_table(results)
+    print(f"saved {save_results('redirect', results, { 'requests': args.requests, 'concurrency': args.concurrency })}")
+
+
+if __name__ == '__main__':
+    main()
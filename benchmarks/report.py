@@ -0,0 +1,79 @@
+import os
+import json
+import subprocess
+from datetime import datetime
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    # Latencies in seconds in, milliseconds out
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def print_table(results):
+    print(f"{'target':<24}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, summary in results.items():
+        print(f"{name:<24}{summary['requests']:>10}{summary['errors']:>8}{summary['rps']:>10}"
+              f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}")
+
+
+def _revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(name, results, parameters=None, path=None):
+    # Writes benchmarks/results/<name>-<timestamp>.json unless a path is given
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+
+    with open(path, 'w') as file:
+        json.dump({
+            'name': name,
+            'revision': _revision(),
+            'created_at': datetime.utcnow().isoformat(),
+            'parameters': parameters or {},
+            'results': results
+        }, file, indent=2, sort_keys=True)
+
+    return path
+
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def print_comparison(baseline, results):
+    # Relative change of every shared numeric metric, e.g. `p99_ms  12.1 -> 9.8  (-19.0%)`
+    baseline = baseline['results']
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        print(name)
+        for metric, value in summary.items():
+            before = baseline[name].get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = f"{(value - before) / before * 100:+.1f}%" if before else 'n/a'
+            print(f"  {metric:<16}{before:>12} -> {value:<12}({change})")
@@ -0,0 +1,321 @@
+import json
+import time
+import random
+import string
+import argparse
+from sqlalchemy import func
+from sqlalchemy.orm import undefer
+from api import create_app
+from api.models import db, User, Url, Document, SearchTerm, SearchDocument, CompressedText, user_urls, get_uuid, hash_long_url, short_code_sequence
+from api.utils.shortcode import short_code_allocator
+from api.utils.patches import apply_patches
+from api.utils.revisions import reverse_delta, SNAPSHOT_INTERVAL
+from api.utils.search import search_documents
+from api.utils.membership import owns_url
+from benchmarks.report import summarize, save_results, load_results, print_comparison
+from benchmarks.synth import Vocabulary
+
+
+# Focused benchmarks for single code paths, run against the configured
+# database after benchmarks.synth, e.g.
+#
+#   python -m benchmarks.scenarios dedup --samples 2000
+#
+# Scale-dependent results (dedup, search) are meant to be rerun after
+# synthesizing 1M, 10M and 50M rows and compared with --compare.
+
+
+def measure(function, samples):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(samples):
+        call_started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _random_code(rng):
+    return 'urrl.link/' + ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(7))
+
+
+def allocator(app, args):
+    # The old generator drew random codes until an existence query came back
+    # empty. At fill ratio f a draw collides with probability f, which is
+    # reproduced here by drawing a taken alias with that probability.
+    rng = random.Random(args.seed)
+    results = {}
+
+    with app.app_context():
+        taken = [short_url for (short_url,) in db.session.query(Url.short_url).limit(10000)]
+        if not taken:
+            raise SystemExit('no urls found, run python -m benchmarks.synth first')
+
+        for fill in (0.5, 0.9, 0.99):
+            queries = [0]
+
+            def retry_loop():
+                while True:
+                    candidate = rng.choice(taken) if rng.random() < fill else _random_code(rng)
+                    queries[0] += 1
+                    if not Url.query.filter_by(short_url=candidate).first():
+                        return candidate
+
+            results[f"retry fill={fill}"] = measure(retry_loop, args.samples)
+            results[f"retry fill={fill}"]['queries_per_code'] = round(queries[0] / args.samples, 2)
+            db.session.close()
+
+        results['allocator'] = measure(short_code_allocator.next_code, args.samples)
+        results['allocator']['queries_per_code'] = round(1 / short_code_sequence.increment, 4)
+        db.session.close()
+
+    return results
+
+
+def dedup(app, args):
+    # Lookup cost on the create path, through the digest index and through
+    # the old full-text comparison, for urls that exist and urls that don't
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        rows = db.session.query(func.count(Url.id)).scalar()
+        existing = [long_url for (long_url,) in db.session.query(Url.long_url)
+                    .filter(Url.is_private == False)
+                    .limit(args.samples)]
+        if not existing:
+            raise SystemExit('no urls found, run python -m benchmarks.synth first')
+        missing = [f"https://bench.example.com/{rng.getrandbits(64):x}" for _ in range(args.samples)]
+
+        def lookups(query, long_urls):
+            long_urls = iter(long_urls * (args.samples // len(long_urls) + 1))
+            return lambda: query(next(long_urls))
+
+        by_hash = lambda long_url: Url.query.filter_by(long_url_hash=hash_long_url(long_url), long_url=long_url, is_private=False).first()
+        by_text = lambda long_url: Url.query.filter_by(long_url=long_url, is_private=False).first()
+        # Unindexed lookups scan the whole table, so they get fewer samples
+        text_samples = min(args.samples, args.scan_samples)
+
+        results = {
+            'hash hit': measure(lookups(by_hash, existing), args.samples),
+            'hash miss': measure(lookups(by_hash, missing), args.samples),
+            'text hit': measure(lookups(by_text, existing), text_samples),
+            'text miss': measure(lookups(by_text, missing), text_samples)
+        }
+        db.session.close()
+
+    for summary in results.values():
+        summary['rows'] = rows
+    return results
+
+
+def compression(app, args):
+    column = CompressedText()
+
+    with app.app_context():
+        documents = Document.query\
+                    .options(undefer(Document.html_text), undefer(Document.plain_text))\
+                    .limit(args.samples)\
+                    .all()
+        if not documents:
+            raise SystemExit('no documents found, run python -m benchmarks.synth first')
+
+        bodies = [body for document in documents for body in (document.html_text, document.plain_text)]
+        ids = [document.id for document in documents]
+        db.session.close()
+
+        stored = [column.process_bind_param(body, None) for body in bodies]
+        raw_bytes = sum(len(body.encode('utf-8')) for body in bodies)
+        stored_bytes = sum(len(value) for value in stored)
+
+        bodies_iter = iter(bodies * (args.samples // len(bodies) + 1))
+        stored_iter = iter(stored * (args.samples // len(stored) + 1))
+        ids_iter = iter(ids * (args.samples // len(ids) + 1))
+
+        def load():
+            document = Document.query.options(undefer(Document.html_text)).get(next(ids_iter))
+            db.session.expunge_all()
+            return document.html_text
+
+        results = {
+            'size': {
+                'bodies': len(bodies),
+                'raw_bytes': raw_bytes,
+                'stored_bytes': stored_bytes,
+                'ratio': round(stored_bytes / raw_bytes, 3) if raw_bytes else 0
+            },
+            'encode': measure(lambda: column.process_bind_param(next(bodies_iter), None), args.samples),
+            'decode': measure(lambda: column.process_result_value(next(stored_iter), None), args.samples),
+            'load body': measure(load, args.samples)
+        }
+        db.session.close()
+
+    return results
+
+
+def edits(app, args):
+    # Patch edits against full-body saves on the wire, and the reverse delta
+    # history they produce against storing every revision in full
+    rng = random.Random(args.seed)
+    vocabulary = Vocabulary(rng)
+    column = CompressedText()
+    body = ''.join(f"<p>{' '.join(vocabulary.sample(rng.randint(40, 120)))}.</p>\n" for _ in range(args.paragraphs))
+
+    patch_bytes = full_bytes = 0
+    deltas = []
+    delta_bytes = snapshot_bytes = full_history_bytes = 0
+    delta_latencies = []
+
+    for revision in range(1, args.samples + 1):
+        start = rng.randint(0, len(body) - 1)
+        end = min(len(body), start + rng.randint(0, 40))
+        patch = { 'start': start, 'end': end, 'text': ' '.join(vocabulary.sample(rng.randint(1, 12))) }
+        new_body = apply_patches(body, [patch], utf16=True)
+
+        patch_bytes += len(json.dumps({ 'id': 'x' * 32, 'base_revision': revision, 'patches': { 'html_text': [patch] } }))
+        full_bytes += len(json.dumps({ 'id': 'x' * 32, 'html_text': new_body }))
+
+        started = time.perf_counter()
+        delta = reverse_delta(body, new_body)
+        delta_latencies.append(time.perf_counter() - started)
+        deltas.append(delta)
+
+        stored_previous = column.process_bind_param(body, None)
+        full_history_bytes += len(stored_previous)
+        if revision % SNAPSHOT_INTERVAL == 0:
+            snapshot_bytes += len(stored_previous)
+        else:
+            delta_bytes += len(column.process_bind_param(json.dumps(delta), None))
+        body = new_body
+
+    # Worst case rebuild walks back SNAPSHOT_INTERVAL - 1 deltas from the latest body
+    chain = deltas[-(SNAPSHOT_INTERVAL - 1):]
+
+    def rebuild():
+        text = body
+        for delta in reversed(chain):
+            text = apply_patches(text, delta)
+        return text
+
+    return {
+        'wire': {
+            'edits': args.samples,
+            'patch_bytes_per_edit': round(patch_bytes / args.samples),
+            'full_bytes_per_edit': round(full_bytes / args.samples)
+        },
+        'history': {
+            'revisions': args.samples,
+            'delta_history_bytes': delta_bytes + snapshot_bytes,
+            'full_history_bytes': full_history_bytes
+        },
+        'reverse delta': summarize(delta_latencies, sum(delta_latencies)),
+        f"rebuild {len(chain)} deltas": measure(rebuild, min(args.samples, 200))
+    }
+
+
+def search(app, args):
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        documents = db.session.query(func.count(SearchDocument.document_id)).scalar()
+        terms = [term for (term,) in db.session.query(SearchTerm.term)
+                    .filter(SearchTerm.document_count > 0)
+                    .order_by(SearchTerm.document_count.desc())
+                    .limit(1000)]
+        # Users with the most documents see the largest candidate sets
+        user_ids = [user_id for (user_id, _) in db.session.query(Document.user_id, func.count(Document.id))
+                    .group_by(Document.user_id)
+                    .order_by(func.count(Document.id).desc())
+                    .limit(20)]
+        if not (terms and user_ids):
+            raise SystemExit('no indexed documents found, run python -m benchmarks.synth first')
+
+        def query():
+            words = rng.sample(terms, rng.randint(1, 3))
+            if rng.random() < 0.2:
+                words[-1] = words[-1][:2] + '*'
+            return ' '.join(words)
+
+        def run(scope):
+            return lambda: search_documents(rng.choice(user_ids), query(), 20, scope)
+
+        results = {
+            'search all': measure(run(None), args.samples),
+            'search owned': measure(run('owned'), args.samples)
+        }
+        db.session.close()
+
+    for summary in results.values():
+        summary['documents'] = documents
+    return results
+
+
+def membership(app, args):
+    # Ownership checks on a url claimed by more and more users, as an EXISTS
+    # probe and as the collection scan it replaced. Everything is rolled back.
+    results = {}
+
+    with app.app_context():
+        try:
+            url = Url(long_url='https://bench.example.com/membership', short_url=f"urrl.link/{short_code_allocator.next_code()}")
+            db.session.add(url)
+            db.session.flush()
+            owners = 0
+
+            for size in (100, 1000, 10000, 100000):
+                rows = [{ 'id': get_uuid(), 'first_name': 'Bench', 'last_name': 'Owner', 'password': '-' } for _ in range(size - owners)]
+                db.session.execute(User.__table__.insert(), rows)
+                db.session.execute(user_urls.insert(), [{ 'user_id': row['id'], 'url_id': url.id } for row in rows])
+                owners = size
+                probe = User.query.get(rows[-1]['id'])
+
+                def collection():
+                    db.session.expire(url, ['users'])
+                    return probe in url.users
+
+                results[f"exists {size}"] = measure(lambda: owns_url(probe.id, url.id), args.samples)
+                results[f"collection {size}"] = measure(collection, min(args.samples, args.scan_samples))
+
+        finally:
+            db.session.rollback()
+            db.session.close()
+
+    return results
+
+
+SCENARIOS = {
+    'allocator': allocator,
+    'dedup': dedup,
+    'compression': compression,
+    'edits': edits,
+    'search': search,
+    'membership': membership
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a focused benchmark scenario')
+    parser.add_argument('scenario', choices=list(SCENARIOS))
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--scan-samples', type=int, default=20, help='samples for lookups that scan a whole table')
+    parser.add_argument('--paragraphs', type=int, default=40, help='document size for the edits scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='where to save the results, defaults to benchmarks/results/')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    app = create_app()
+    results = SCENARIOS[args.scenario](app, args)
+
+    print(json.dumps(results, indent=2, default=str))
+    path = save_results(args.scenario, results, {
+        'samples': args.samples,
+        'seed': args.seed
+    }, args.output)
+    print(f"saved {path}")
+
+    if args.compare:
+        print_comparison(load_results(args.compare), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import json
+import random
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json import jsonify as flask_jsonify
+from api.utils.helpers import number_to_month, MAX_PAGE_SIZE
+from api.utils.serialization import JSONProvider
+from benchmarks.report import print_table, save_results, load_results, print_comparison
+from benchmarks.scenarios import measure
+from benchmarks.synth import Vocabulary
+
+
+# Encodes representative response bodies with Flask's jsonify and with the
+# orjson provider, response object included, e.g.
+#
+#   python -m benchmarks.serialization --samples 200
+#
+# Needs no database. Both encoders must decode to the same document, which is
+# checked before anything is timed.
+
+
+def document_payload(vocabulary, size):
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = '<p>' + ' '.join(vocabulary.sample(80)) + '</p>'
+        paragraphs.append(paragraph)
+        length += len(paragraph)
+
+    return {
+        'id': '9b1deb4d3b7d4bad9bdd2b0d7b3dcb6d',
+        'title': ' '.join(vocabulary.sample(6)),
+        'html_text': ''.join(paragraphs),
+        'users_sharing': [f"user{number}@example.com" for number in range(5)],
+        'private': False,
+        'revision': 42
+    }
+
+
+def pie(rng, labels):
+    counts = sorted((Decimal(rng.randint(1, 100000)) for _ in labels), reverse=True)
+    total = sum(counts)
+    return [{ 'x': label, 'y': count, 'text': str(round((count/total * 100), 1)) + '%' } for label, count in zip(labels, counts)]
+
+
+def urls_payload(rng):
+    return {
+        'urls': [{
+            'id': f"{rng.getrandbits(128):032x}",
+            'short_url': f"urrl.link/{rng.getrandbits(40):x}",
+            'long_url': f"https://bench.example.com/{rng.getrandbits(64):x}/{rng.getrandbits(64):x}",
+            'alias': f"{rng.getrandbits(40):x}",
+            'private': rng.random() < 0.2
+        } for _ in range(MAX_PAGE_SIZE)],
+        'next_cursor': 'MjAyMi0wOS0wOFQxNjo0MDoyMS4zMzc4MTV8MTIzNDU=',
+        'top_stats': pie(rng, [f"urrl.link/{number}" for number in range(5)])
+    }
+
+
+def documents_payload(rng, vocabulary):
+    return {
+        'documents': [{
+            'id': f"{rng.getrandbits(128):032x}",
+            'title': ' '.join(vocabulary.sample(6)),
+            'snippet': ' '.join(vocabulary.sample(40)),
+            'private': rng.random() < 0.2
+        } for _ in range(MAX_PAGE_SIZE)],
+        'next_cursor': 'MjAyMi0wOS0wOFQxNjo0MDoyMS4zMzc4MTV8MTIzNDU=',
+        'top_stats': pie(rng, [' '.join(vocabulary.sample(3)) for _ in range(5)])
+    }
+
+
+def stats_payload(rng):
+    # The shape of StatsSnapshot: [year, month] points and a datetime
+    start = datetime(2020, 1, 1)
+    months = [start + timedelta(days=31 * number) for number in range(36)]
+    series = lambda: [(month.year, month.month, rng.randint(0, 100000)) for month in months]
+    url_grouped, document_grouped = series(), series()
+
+    return {
+        'url_pie': pie(rng, [f"urrl.link/{number}" for number in range(5)]),
+        'document_pie': pie(rng, [f"document {number}" for number in range(5)]),
+        'stacked': [
+            [{ 'x': number_to_month[stat[1]], 'y': stat[2] } for stat in url_grouped],
+            [{ 'x': number_to_month[stat[1]], 'y': stat[2] } for stat in document_grouped]
+        ],
+        'line': [
+            [{ 'x': [stat[0], stat[1]], 'y': stat[2] } for stat in url_grouped],
+            [{ 'x': [stat[0], stat[1]], 'y': stat[2] } for stat in document_grouped]
+        ],
+        'generated_at': datetime.utcnow()
+    }
+
+
+def payloads(seed):
+    rng = random.Random(seed)
+    vocabulary = Vocabulary(rng)
+    return {
+        'document_100kb': document_payload(vocabulary, 100 * 1024),
+        'document_1mb': document_payload(vocabulary, 1024 * 1024),
+        'document_5mb': document_payload(vocabulary, 5 * 1024 * 1024),
+        'user_urls': urls_payload(rng),
+        'user_documents': documents_payload(rng, vocabulary),
+        'stats': stats_payload(rng)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON encoders on representative response bodies')
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='where to save the results, defaults to benchmarks/results/')
+    parser.add_argument('--compare', default=None, help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['JSON_ENCODER'] = 'orjson'
+    provider = JSONProvider()
+    provider.init_app(app)
+    if provider.encoder != 'orjson':
+        raise SystemExit('orjson is not installed')
+
+    results = {}
+    with app.app_context():
+        for name, payload in payloads(args.seed).items():
+            if json.loads(flask_jsonify(payload).get_data()) != json.loads(provider.response(payload).get_data()):
+                raise SystemExit(f"encoders disagree on {name}")
+
+            results[f"{name}:stdlib"] = measure(lambda: flask_jsonify(payload), args.samples)
+            results[f"{name}:orjson"] = measure(lambda: provider.response(payload), args.samples)
+
+    print_table(results)
+    path = save_results('serialization', results, { 'samples': args.samples, 'seed': args.seed }, args.output)
+    print(f"saved {path}")
+
+    if args.compare:
+        print_comparison(load_results(args.compare), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import time
+import random
+import argparse
+import itertools
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from api import create_app
+from api.models import db, User, Url, Document, Visit, user_urls, document_shared_users, get_uuid, hash_long_url, SNIPPET_LENGTH
+from api.utils.shortcode import short_code_allocator
+from api.utils.rollups import rebuild_rollups
+from api.utils.search import index_document
+
+
+# Fills the configured database with synthetic users, urls, documents and
+# visits, e.g.
+#
+#   python -m benchmarks.synth --users 1000 --urls 1000000 --documents 100000 --visits 10000000
+#
+# Popularity follows a Zipf distribution, so a few urls and documents get
+# most of the visits, and words in document bodies are skewed the same way.
+# Every user gets the same password so the driver can log in as anyone.
+
+PASSWORD = 'benchmark'
+# One dot only, or validate_email turns every login away
+EMAIL_DOMAIN = 'benchurrl.test'
+CHUNK_SIZE = 10000
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'da', 're', 'po', 'xi', 'an', 'el', 'or', 'un']
+HOSTS = ['example.com', 'news.example.org', 'shop.example.net', 'docs.example.io', 'blog.example.dev']
+
+
+def email(number):
+    return f"user{number}@{EMAIL_DOMAIN}"
+
+
+def zipf_weights(count, exponent):
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Vocabulary:
+
+    def __init__(self, rng, size=20000, exponent=1.07):
+        self.rng = rng
+        self.words = sorted({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(size)})
+        rng.shuffle(self.words)
+        self.weights = zipf_weights(len(self.words), exponent)
+
+    def sample(self, count):
+        return self.rng.choices(self.words, cum_weights=self.weights, k=count)
+
+
+def _chunks(count):
+    for start in range(0, count, CHUNK_SIZE):
+        yield range(start, min(start + CHUNK_SIZE, count))
+
+
+def _random_time(rng, now, days):
+    return now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+
+
+def _progress(label, done, total, started):
+    print(f"\r{label}: {done}/{total} ({time.monotonic() - started:.0f}s)", end='', flush=True)
+    if done == total:
+        print()
+
+
+def make_users(rng, count, now, days):
+    password = generate_password_hash(PASSWORD)
+    # Numbering continues after earlier runs so emails stay unique
+    offset = User.query.filter(User.email.like(f"%@{EMAIL_DOMAIN}")).count()
+    user_ids = []
+    started = time.monotonic()
+
+    for numbers in _chunks(count):
+        numbers = range(offset + numbers.start, offset + numbers.stop)
+        rows = [{
+            'id': get_uuid(),
+            'first_name': 'Bench',
+            'last_name': f"User{number}",
+            'email': email(number),
+            'password': password,
+            'created_at': _random_time(rng, now, days)
+        } for number in numbers]
+        db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+        user_ids.extend(row['id'] for row in rows)
+        _progress('users', len(user_ids), count, started)
+
+    return user_ids
+
+
+def make_urls(rng, count, user_ids, now, days, owned_ratio, private_ratio):
+    url_ids = []
+    started = time.monotonic()
+
+    for numbers in _chunks(count):
+        rows = []
+        owners = []
+        for number in numbers:
+            long_url = f"https://{rng.choice(HOSTS)}/{number}/{rng.getrandbits(40):x}"
+            owned = bool(user_ids) and rng.random() < owned_ratio
+            rows.append({
+                'id': get_uuid(),
+                'short_url': f"urrl.link/{short_code_allocator.next_code()}",
+                'long_url': long_url,
+                'long_url_hash': hash_long_url(long_url),
+                'is_private': owned and rng.random() < private_ratio,
+                'created_at': _random_time(rng, now, days)
+            })
+            if owned:
+                owners.append({ 'user_id': rng.choice(user_ids), 'url_id': rows[-1]['id'], 'created_at': rows[-1]['created_at'] })
+
+        db.session.execute(Url.__table__.insert(), rows)
+        if owners:
+            db.session.execute(user_urls.insert(), owners)
+        db.session.commit()
+        url_ids.extend(row['id'] for row in rows)
+        _progress('urls', len(url_ids), count, started)
+
+    return url_ids
+
+
+def make_documents(rng, vocabulary, count, user_ids, now, days, private_ratio, share_ratio, index):
+    document_ids = []
+    started = time.monotonic()
+
+    for numbers in _chunks(count):
+        rows = []
+        shares = []
+        for _ in numbers:
+            paragraphs = [' '.join(vocabulary.sample(rng.randint(20, 120))) for _ in range(rng.randint(1, 12))]
+            plain_text = '\n'.join(paragraphs)
+            created_at = _random_time(rng, now, days)
+            rows.append({
+                'id': get_uuid(),
+                'title': ' '.join(vocabulary.sample(rng.randint(2, 5)))[:50],
+                'user_id': rng.choice(user_ids),
+                'html_text': ''.join(f"<p>{paragraph}</p>" for paragraph in paragraphs),
+                'plain_text': plain_text,
+                'snippet': plain_text[:SNIPPET_LENGTH],
+                'revision': 1,
+                'is_private': rng.random() < private_ratio,
+                'created_at': created_at
+            })
+            if rng.random() < share_ratio:
+                for user_id in set(rng.sample(user_ids, min(len(user_ids), rng.randint(1, 5)))):
+                    shares.append({ 'user_id': user_id, 'document_id': rows[-1]['id'] })
+
+        db.session.execute(Document.__table__.insert(), rows)
+        if shares:
+            db.session.execute(document_shared_users.insert(), shares)
+        if index:
+            for row in rows:
+                index_document(row['id'], row['title'], row['plain_text'])
+        db.session.commit()
+        document_ids.extend(row['id'] for row in rows)
+        _progress('documents', len(document_ids), count, started)
+
+    return document_ids
+
+
+def make_visits(rng, count, url_ids, document_ids, now, days, document_ratio, exponent):
+    # Targets are shuffled before ranking so popularity doesn't follow creation order
+    url_ids = rng.sample(url_ids, len(url_ids))
+    document_ids = rng.sample(document_ids, len(document_ids))
+    url_weights = zipf_weights(len(url_ids), exponent) if url_ids else None
+    document_weights = zipf_weights(len(document_ids), exponent) if document_ids else None
+    written = 0
+    started = time.monotonic()
+
+    for numbers in _chunks(count):
+        if not document_ids:
+            document_count = 0
+        elif not url_ids:
+            document_count = len(numbers)
+        else:
+            document_count = sum(rng.random() < document_ratio for _ in numbers)
+
+        urls = rng.choices(url_ids, cum_weights=url_weights, k=len(numbers) - document_count) if url_ids else []
+        documents = rng.choices(document_ids, cum_weights=document_weights, k=document_count) if document_ids else []
+
+        rows = [{ 'id': get_uuid(), 'url_id': url_id, 'document_id': None, 'time': _random_time(rng, now, days) } for url_id in urls]
+        rows += [{ 'id': get_uuid(), 'url_id': None, 'document_id': document_id, 'time': _random_time(rng, now, days) } for document_id in documents]
+
+        if rows:
+            db.session.execute(Visit.__table__.insert(), rows)
+            db.session.commit()
+        written += len(numbers)
+        _progress('visits', written, count, started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset in the configured database')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--urls', type=int, default=100000)
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--visits', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=365, help='spread creation and visit times over this many days')
+    parser.add_argument('--owned-ratio', type=float, default=0.3, help='share of urls created by a registered user')
+    parser.add_argument('--private-ratio', type=float, default=0.2)
+    parser.add_argument('--share-ratio', type=float, default=0.1, help='share of documents shared with other users')
+    parser.add_argument('--document-visit-ratio', type=float, default=0.2)
+    parser.add_argument('--zipf', type=float, default=1.1, help='exponent of the visit popularity distribution')
+    parser.add_argument('--no-index', action='store_true', help='skip building the search index')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    app = create_app()
+
+    with app.app_context():
+        try:
+            user_ids = make_users(rng, args.users, now, args.days)
+            url_ids = make_urls(rng, args.urls, user_ids, now, args.days, args.owned_ratio, args.private_ratio)
+            document_ids = make_documents(rng, Vocabulary(rng), args.documents, user_ids, now, args.days,
+                                          args.private_ratio, args.share_ratio, not args.no_index) if user_ids else []
+            make_visits(rng, args.visits, url_ids, document_ids, now, args.days, args.document_visit_ratio, args.zipf)
+
+            print('rebuilding visit rollups')
+            rebuild_rollups()
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        finally:
+            db.session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import os
+from prometheus_client import multiprocess
+
+
+# Workers share metrics through PROMETHEUS_MULTIPROC_DIR when it is set;
+# samples of workers that have exited are folded into the totals here. It
+# has to be in the environment gunicorn starts with, before workers fork,
+# and is left unset by default, when each worker only reports its own.
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
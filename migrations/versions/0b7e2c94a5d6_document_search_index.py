@@ -0,0 +1,48 @@
+"""document search index
+
+Revision ID: 0b7e2c94a5d6
+Revises: f3a0d58e6b21
+Create Date: 2022-09-03 13:46:10.905271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e2c94a5d6'
+down_revision = 'f3a0d58e6b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_terms',
+        sa.Column('term', sa.String(length=64), nullable=False),
+        sa.Column('document_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('term')
+    )
+    op.create_index('ix_search_terms_term_pattern', 'search_terms', ['term'], postgresql_ops={'term': 'varchar_pattern_ops'})
+    op.create_table('search_postings',
+        sa.Column('term', sa.String(length=64), nullable=False),
+        sa.Column('document_id', sa.String(length=32), nullable=False),
+        sa.Column('frequency', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('term', 'document_id')
+    )
+    op.create_index('ix_search_postings_document_id', 'search_postings', ['document_id'])
+    op.create_table('search_documents',
+        sa.Column('document_id', sa.String(length=32), nullable=False),
+        sa.Column('length', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('document_id')
+    )
+    # Existing documents are indexed with `flask documents reindex`
+
+
+def downgrade():
+    op.drop_table('search_documents')
+    op.drop_index('ix_search_postings_document_id', table_name='search_postings')
+    op.drop_table('search_postings')
+    op.drop_index('ix_search_terms_term_pattern', table_name='search_terms')
+    op.drop_table('search_terms')
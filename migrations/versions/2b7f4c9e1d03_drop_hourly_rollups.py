@@ -0,0 +1,39 @@
+"""drop hourly visit rollups
+
+Revision ID: 2b7f4c9e1d03
+Revises: 9c2d5e7a1b48
+Create Date: 2022-09-12 11:02:47.905214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b7f4c9e1d03'
+down_revision = '9c2d5e7a1b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nothing reads the hourly buckets, every series is served from the daily ones
+    op.drop_index('uq_visit_rollups_hourly_document', table_name='visit_rollups_hourly')
+    op.drop_index('uq_visit_rollups_hourly_url', table_name='visit_rollups_hourly')
+    op.drop_table('visit_rollups_hourly')
+
+
+def downgrade():
+    op.create_table('visit_rollups_hourly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('url_id', sa.String(length=32), nullable=True),
+        sa.Column('document_id', sa.String(length=32), nullable=True),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_visit_rollups_hourly_url', 'visit_rollups_hourly', ['url_id', 'bucket'], unique=True, postgresql_where=sa.text('url_id IS NOT NULL'))
+    op.create_index('uq_visit_rollups_hourly_document', 'visit_rollups_hourly', ['document_id', 'bucket'], unique=True, postgresql_where=sa.text('document_id IS NOT NULL'))
+    # Refilled with `flask rollups backfill` on the older code
@@ -0,0 +1,41 @@
+"""visit rollup tables
+
+Revision ID: 3f9c1a7d2b64
+Revises: ee72ed354eda
+Create Date: 2022-08-02 10:14:22.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1a7d2b64'
+down_revision = 'ee72ed354eda'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, bucket_type in (('visit_rollups_hourly', sa.DateTime()), ('visit_rollups_daily', sa.Date())):
+        op.create_table(table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('url_id', sa.String(length=32), nullable=True),
+            sa.Column('document_id', sa.String(length=32), nullable=True),
+            sa.Column('bucket', bucket_type, nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['url_id'], ['urls.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(f'uq_{table}_url', table, ['url_id', 'bucket'], unique=True, postgresql_where=sa.text('url_id IS NOT NULL'))
+        op.create_index(f'uq_{table}_document', table, ['document_id', 'bucket'], unique=True, postgresql_where=sa.text('document_id IS NOT NULL'))
+
+    # Existing visits are folded in with `flask rollups backfill`
+
+
+def downgrade():
+    for table in ('visit_rollups_daily', 'visit_rollups_hourly'):
+        op.drop_index(f'uq_{table}_document', table_name=table)
+        op.drop_index(f'uq_{table}_url', table_name=table)
+        op.drop_table(table)
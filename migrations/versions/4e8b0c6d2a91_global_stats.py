@@ -0,0 +1,29 @@
+"""global stats snapshot
+
+Revision ID: 4e8b0c6d2a91
+Revises: 7a3d91c5e2f8
+Create Date: 2022-09-14 10:41:53.274180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b0c6d2a91'
+down_revision = '7a3d91c5e2f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('global_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('generated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('global_stats')
@@ -0,0 +1,39 @@
+"""visit and association table indexes
+
+Revision ID: 5d83f2a6e9c7
+Revises: c47a9e0b5d18
+Create Date: 2022-08-12 14:27:39.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d83f2a6e9c7'
+down_revision = 'c47a9e0b5d18'
+branch_labels = None
+depends_on = None
+
+
+indexes = [
+    ('ix_visits_url_id_time', 'visits', ['url_id', 'time']),
+    ('ix_visits_document_id_time', 'visits', ['document_id', 'time']),
+    ('ix_user_urls_user_id_url_id', 'user_urls', ['user_id', 'url_id']),
+    ('ix_user_urls_url_id', 'user_urls', ['url_id']),
+    ('ix_document_shared_users_document_id_user_id', 'document_shared_users', ['document_id', 'user_id']),
+    ('ix_document_shared_users_user_id', 'document_shared_users', ['user_id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,80 @@
+"""unique association keys
+
+Revision ID: 6e4a9b2d7f13
+Revises: 0b7e2c94a5d6
+Create Date: 2022-09-06 10:12:48.551362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e4a9b2d7f13'
+down_revision = '0b7e2c94a5d6'
+branch_labels = None
+depends_on = None
+
+
+indexes = [
+    ('ix_user_urls_user_id_url_id', 'user_urls', ['user_id', 'url_id']),
+    ('ix_document_shared_users_document_id_user_id', 'document_shared_users', ['document_id', 'user_id']),
+]
+
+
+# Builds of an index tried before giving up
+ATTEMPTS = 3
+
+
+def _dedup(table, columns):
+    # The ORM appended to these collections after a membership check, so
+    # concurrent requests could store the same pair twice
+    first, second = columns
+    op.execute(
+        f'DELETE FROM {table} a USING {table} b '
+        f'WHERE a.ctid < b.ctid AND a.{first} = b.{first} AND a.{second} = b.{second}'
+    )
+
+
+def _valid(name):
+    return op.get_bind().execute(
+        sa.text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'), name=name
+    ).scalar()
+
+
+def _build(name, table, columns, unique):
+    # The app keeps writing during a concurrent build, so a pair can be
+    # duplicated again after the dedup. The build then fails and leaves an
+    # invalid index behind, which is dropped before deduplicating again.
+    for _ in range(ATTEMPTS):
+        if unique:
+            _dedup(table, columns)
+        try:
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+        except sa.exc.IntegrityError:
+            pass
+        if _valid(name):
+            return
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+    raise RuntimeError(f'could not build {name} after {ATTEMPTS} attempts')
+
+
+def _replace(name, table, columns, unique):
+    # Build the new index next to the old one, then swap the names, so
+    # lookups keep an index the whole time
+    _build(f'{name}_new', table, columns, unique)
+    op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            _replace(name, table, columns, unique=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            _replace(name, table, columns, unique=False)
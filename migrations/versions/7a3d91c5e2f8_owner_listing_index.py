@@ -0,0 +1,54 @@
+"""url listing by owner
+
+Revision ID: 7a3d91c5e2f8
+Revises: 2b7f4c9e1d03
+Create Date: 2022-09-13 15:26:08.117394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3d91c5e2f8'
+down_revision = '2b7f4c9e1d03'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+BACKFILL = sa.text(
+    "UPDATE user_urls SET created_at = coalesce(urls.created_at, user_urls.created_at) FROM urls "
+    "WHERE urls.id = user_urls.url_id AND (user_urls.user_id, user_urls.url_id) IN ("
+    "  SELECT user_id, url_id FROM user_urls WHERE (user_id, url_id) > (:user_id, :url_id) "
+    "  ORDER BY user_id, url_id LIMIT :batch"
+    ") RETURNING user_urls.user_id, user_urls.url_id"
+)
+
+
+def upgrade():
+    # The url listing joins through user_urls, so the global (created_at, id)
+    # index on urls couldn't serve it. The sort key now lives next to the owner.
+    # Rows inserted from here on get the insert time from the server default.
+    op.add_column('user_urls', sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text("timezone('utc', now())")))
+
+    # Existing rows take the url's creation time, in committed batches
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        after = ('', '')
+        while True:
+            keys = connection.execute(BACKFILL, { 'user_id': after[0], 'url_id': after[1], 'batch': BATCH_SIZE }).all()
+            if not keys:
+                break
+            after = tuple(max(keys))
+
+        op.create_index('ix_user_urls_user_id_created_at_url_id', 'user_urls', ['user_id', 'created_at', 'url_id'], postgresql_concurrently=True)
+        op.drop_index('ix_urls_created_at_id', table_name='urls', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_urls_created_at_id', 'urls', ['created_at', 'id'], postgresql_concurrently=True)
+        op.drop_index('ix_user_urls_user_id_created_at_url_id', table_name='user_urls', postgresql_concurrently=True)
+
+    op.drop_column('user_urls', 'created_at')
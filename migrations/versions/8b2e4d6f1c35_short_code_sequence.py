@@ -0,0 +1,26 @@
+"""short code sequence
+
+Revision ID: 8b2e4d6f1c35
+Revises: 3f9c1a7d2b64
+Create Date: 2022-08-05 18:42:07.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1c35'
+down_revision = '3f9c1a7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Increment must match the block size leased by ShortCodeAllocator
+    op.execute(CreateSequence(sa.Sequence('short_code_seq', start=1, increment=1000)))
+
+
+def downgrade():
+    op.execute(DropSequence(sa.Sequence('short_code_seq')))
@@ -0,0 +1,27 @@
+"""document share permissions
+
+Revision ID: 9c2d5e7a1b48
+Revises: 6e4a9b2d7f13
+Create Date: 2022-09-08 16:40:21.337815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2d5e7a1b48'
+down_revision = '6e4a9b2d7f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing shares keep the edit access they had
+    op.add_column('document_shared_users', sa.Column('permission', sa.String(length=10), nullable=False, server_default='edit'))
+    op.add_column('documents', sa.Column('acl_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('documents', 'acl_version')
+    op.drop_column('document_shared_users', 'permission')
@@ -0,0 +1,28 @@
+"""keyset pagination indexes
+
+Revision ID: a1c6e3f87b92
+Revises: 5d83f2a6e9c7
+Create Date: 2022-08-16 09:51:13.286470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c6e3f87b92'
+down_revision = '5d83f2a6e9c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_urls_created_at_id', 'urls', ['created_at', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_documents_user_id_created_at_id', 'documents', ['user_id', 'created_at', 'id'], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_documents_user_id_created_at_id', table_name='documents', postgresql_concurrently=True)
+        op.drop_index('ix_urls_created_at_id', table_name='urls', postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""long_url hash for deduplication
+
+Revision ID: c47a9e0b5d18
+Revises: 8b2e4d6f1c35
+Create Date: 2022-08-09 21:03:51.730644
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a9e0b5d18'
+down_revision = '8b2e4d6f1c35'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+# Same digest as api.models.hash_long_url: hex sha256 of the UTF-8 bytes
+BACKFILL = sa.text(
+    "UPDATE urls SET long_url_hash = encode(sha256(convert_to(long_url, 'UTF8')), 'hex') "
+    "WHERE id IN ("
+    "  SELECT id FROM urls WHERE id > :after AND long_url IS NOT NULL AND long_url_hash IS NULL "
+    "  ORDER BY id LIMIT :batch"
+    ") RETURNING id"
+)
+
+
+def upgrade():
+    op.add_column('urls', sa.Column('long_url_hash', sa.String(length=64), nullable=True))
+
+    # Batches walk the primary key and commit one at a time, so row locks and
+    # WAL are released as the backfill goes instead of in one long transaction
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        after = ''
+        while True:
+            ids = connection.execute(BACKFILL, { 'after': after, 'batch': BATCH_SIZE }).scalars().all()
+            if not ids:
+                break
+            after = max(ids)
+
+        op.create_index('ix_urls_long_url_hash_public', 'urls', ['long_url_hash'], postgresql_where=sa.text('is_private = false'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_urls_long_url_hash_public', table_name='urls', postgresql_concurrently=True)
+
+    op.drop_column('urls', 'long_url_hash')
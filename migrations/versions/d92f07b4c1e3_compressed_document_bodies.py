@@ -0,0 +1,36 @@
+"""compressed document bodies
+
+Revision ID: d92f07b4c1e3
+Revises: a1c6e3f87b92
+Create Date: 2022-08-20 16:08:44.631927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd92f07b4c1e3'
+down_revision = 'a1c6e3f87b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('snippet', sa.String(length=200), nullable=True))
+    op.execute("UPDATE documents SET snippet = substr(plain_text, 1, 200)")
+
+    # Existing bodies keep their bytes behind the RAW header (0x00), which
+    # CompressedText reads as-is. `flask documents compress` rewrites them.
+    for column in ('html_text', 'plain_text'):
+        op.alter_column('documents', column, type_=sa.LargeBinary(), existing_nullable=False,
+                        postgresql_using=f"'\\x00'::bytea || convert_to({column}, 'UTF8')")
+
+
+def downgrade():
+    # Compressed rows (0x01 header) have to be rewritten raw before downgrading
+    for column in ('html_text', 'plain_text'):
+        op.alter_column('documents', column, type_=sa.Text(), existing_nullable=False,
+                        postgresql_using=f"convert_from(substring({column} from 2), 'UTF8')")
+
+    op.drop_column('documents', 'snippet')
@@ -0,0 +1,24 @@
+"""document revision counter
+
+Revision ID: e5b18c3a7f40
+Revises: d92f07b4c1e3
+Create Date: 2022-08-24 11:35:02.117853
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b18c3a7f40'
+down_revision = 'd92f07b4c1e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('documents', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('documents', 'revision')
@@ -0,0 +1,39 @@
+"""document revision history
+
+Revision ID: f3a0d58e6b21
+Revises: e5b18c3a7f40
+Create Date: 2022-08-29 19:22:47.380512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a0d58e6b21'
+down_revision = 'e5b18c3a7f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('document_revisions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_id', sa.String(length=32), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('editor_id', sa.String(length=32), nullable=True),
+        sa.Column('title', sa.String(length=50), nullable=False),
+        sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+        sa.Column('html_text', sa.LargeBinary(), nullable=True),
+        sa.Column('plain_text', sa.LargeBinary(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['editor_id'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_document_revisions_document_id_revision', 'document_revisions', ['document_id', 'revision'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_document_revisions_document_id_revision', table_name='document_revisions')
+    op.drop_table('document_revisions')
@@ -0,0 +1,102 @@
+import asyncio
+from functools import partial
+from flask import Flask
+from api.config import ApplicationConfig
+from api.models import db
+from api.utils.cache import alias_cache, MISSING
+from api.utils.helpers import sanitize_short_url, resolve_short_url
+from api.utils.visits import visit_recorder
+
+
+# Serves short link redirects on their own, without the CORS, JWT and
+# blueprint stack of the main app:
+#
+#   uvicorn redirect:application --workers 4
+#
+# GET /<alias> answers with a redirect to the long url. The Flask app below
+# only carries the config and the database for the shared helpers.
+
+
+def create_redirect_app():
+    app = Flask(__name__)
+    app.config.from_object(ApplicationConfig)
+
+    db.init_app(app)
+    alias_cache.configure(maxsize=app.config['ALIAS_CACHE_SIZE'], ttl=app.config['ALIAS_CACHE_TTL'])
+    visit_recorder.init_app(app)
+
+    return app
+
+
+app = create_redirect_app()
+
+
+def _resolve(short_url):
+    with app.app_context():
+        return resolve_short_url(short_url)
+
+
+def _record(url_id):
+    with app.app_context():
+        try:
+            visit_recorder.record(url_id=url_id)
+        except Exception:
+            app.logger.exception('failed to record visit for url %s', url_id)
+
+
+async def _respond(send, status, headers, body=b''):
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({ 'type': 'http.response.start', 'status': status, 'headers': headers })
+    await send({ 'type': 'http.response.body', 'body': body })
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({ 'type': 'lifespan.startup.complete' })
+        elif message['type'] == 'lifespan.shutdown':
+            visit_recorder.shutdown()
+            await send({ 'type': 'lifespan.shutdown.complete' })
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] not in ('GET', 'HEAD'):
+        return await _respond(send, 405, [('allow', 'GET, HEAD')])
+
+    short_url = sanitize_short_url(scope['path'].strip('/'))
+    if not short_url:
+        return await _respond(send, 404, [('cache-control', 'no-store')], b'url does not exist')
+
+    loop = asyncio.get_running_loop()
+
+    # Cache hits are answered on the event loop; only misses wait on the database
+    resolved = alias_cache.get(short_url)
+    if resolved is None:
+        resolved = await loop.run_in_executor(None, _resolve, short_url)
+    elif resolved is MISSING:
+        resolved = None
+
+    if not resolved:
+        return await _respond(send, 404, [('cache-control', 'no-store')], b'url does not exist')
+
+    url_id, long_url, _ = resolved
+
+    # Queued for the background writer when there's room, otherwise written
+    # from the thread pool; the redirect never waits on either
+    if not visit_recorder.try_record(url_id=url_id):
+        loop.run_in_executor(None, partial(_record, url_id))
+
+    max_age = app.config['REDIRECT_MAX_AGE']
+    await _respond(send, app.config['REDIRECT_STATUS'], [
+        ('location', long_url),
+        ('cache-control', f'private, max-age={max_age}' if max_age else 'no-cache')
+    ])
@@ -0,0 +1,31 @@
+import os
+import pytest
+
+
+# api.config reads these when it's imported. The app only ever points at
+# TEST_DATABASE_URL here, since the database tests drop and recreate every
+# table; without it they are skipped.
+os.environ.setdefault('JWT_SECRET_KEY', 'test')
+os.environ.setdefault('JWT_COOKIE_SECURE', 'False')
+os.environ.setdefault('JWT_COOKIE_CSRF_PROTECT', 'False')
+os.environ.setdefault('JWT_CSRF_CHECK_FORM', 'False')
+os.environ.setdefault('FRONTEND', 'http://localhost:3000')
+os.environ['GCP_DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'postgresql:///urrl_test_unset')
+os.environ['REPLICA_DATABASE_URLS'] = ''
+os.environ['VISIT_RECORDING_MODE'] = 'sync'
+os.environ['PASSWORD_WORKERS'] = '0'
+
+
+@pytest.fixture(scope='session')
+def app():
+    if 'TEST_DATABASE_URL' not in os.environ:
+        pytest.skip('set TEST_DATABASE_URL to a scratch PostgreSQL database')
+
+    from api import create_app
+    from api.models import db
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
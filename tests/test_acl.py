@@ -0,0 +1,113 @@
+from hashlib import md5
+import pytest
+from flask_jwt_extended import create_access_token
+from api.models import db, User
+from api.utils.acl import acl_cache
+
+
+# Shares documents through the routes and checks what each role can do with
+# them, including right after a share changes while decisions are cached
+
+ROLES = ['owner', 'editor', 'viewer', 'stranger']
+
+
+def user_id(role):
+    return md5(f"acl-{role}".encode()).hexdigest()
+
+
+def email(role):
+    return f"{role}@acl.example.com"
+
+
+@pytest.fixture
+def clients(app):
+    with app.app_context():
+        for role in ROLES:
+            if User.query.get(user_id(role)) is None:
+                db.session.add(User(id=user_id(role), first_name='Acl', last_name=role.title(), email=email(role), password='-'))
+        db.session.commit()
+        db.session.close()
+
+    clients = {}
+    for role in ROLES:
+        clients[role] = app.test_client()
+        with app.app_context():
+            clients[role].set_cookie('localhost', 'access_token_cookie', create_access_token(identity=user_id(role)))
+    return clients
+
+
+def share(clients, document_id, role, permission=None, add_user=True):
+    fields = { 'id': document_id, 'user_email': email(role), 'add_user': add_user }
+    if permission:
+        fields['permission'] = permission
+    return clients['owner'].patch('/api/v1/document/edit/sharing', json=fields)
+
+
+def shared_document(clients, private):
+    response = clients['owner'].post('/api/v1/document/create', json={
+        'title': 'Shared', 'html_text': '<p>shared</p>', 'plain_text': 'shared', 'is_private': private
+    })
+    document_id = response.json['id']
+    assert share(clients, document_id, 'editor', 'edit').status_code == 201
+    assert share(clients, document_id, 'viewer', 'view').status_code == 201
+    return document_id
+
+
+def view(client, document_id):
+    return client.get(f"/api/v1/document/id/{document_id}").status_code
+
+
+def edit(client, document_id, **fields):
+    return client.patch('/api/v1/document/edit', json={ 'id': document_id, 'title': 'Edited', **fields }).status_code
+
+
+@pytest.mark.parametrize('private, role, can_view, can_edit', [
+    (False, 'owner', True, True),
+    (False, 'editor', True, True),
+    (False, 'viewer', True, False),
+    (False, 'stranger', True, False),
+    (True, 'owner', True, True),
+    (True, 'editor', True, True),
+    (True, 'viewer', True, False),
+    (True, 'stranger', False, False)
+])
+def test_roles_on_public_and_private_documents(clients, private, role, can_view, can_edit):
+    document_id = shared_document(clients, private)
+
+    # Twice, so the second answer comes from the cached decision
+    for _ in range(2):
+        assert view(clients[role], document_id) == (200 if can_view else 403)
+        assert edit(clients[role], document_id, title=f"Edited by {role}") == (201 if can_edit else 403)
+
+
+def test_only_the_owner_changes_privacy(clients):
+    document_id = shared_document(clients, private=False)
+    assert view(clients['stranger'], document_id) == 200
+
+    assert edit(clients['editor'], document_id, is_private=True) == 403
+    assert view(clients['stranger'], document_id) == 200
+
+    assert edit(clients['owner'], document_id, is_private=True) == 201
+    assert view(clients['stranger'], document_id) == 403
+    assert view(clients['viewer'], document_id) == 200
+
+    assert edit(clients['owner'], document_id, is_private=False) == 201
+    assert view(clients['stranger'], document_id) == 200
+
+
+def test_a_downgrade_takes_effect_immediately(clients):
+    document_id = shared_document(clients, private=True)
+    assert edit(clients['editor'], document_id, title='Before') == 201
+    assert any(key[0] == document_id and key[2] == user_id('editor') for key in acl_cache.keys())
+
+    assert share(clients, document_id, 'editor', 'view').json['permissions'][email('editor')] == 'view'
+    assert edit(clients['editor'], document_id, title='After') == 403
+    assert view(clients['editor'], document_id) == 200
+
+
+def test_an_unshared_user_loses_access_immediately(clients):
+    document_id = shared_document(clients, private=True)
+    assert view(clients['viewer'], document_id) == 200
+
+    assert share(clients, document_id, 'viewer', add_user=False).status_code == 201
+    assert view(clients['viewer'], document_id) == 403
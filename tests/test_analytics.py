@@ -0,0 +1,50 @@
+import time
+import pytest
+from flask import g
+from api.models import db
+from api.utils import analytics
+from api.utils.analytics import analytics_cache, user_analytics
+from api.utils.routing import replica_router, WROTE_COOKIE
+
+
+# Reads analytics as if the request had been sent to a replica, which here is
+# the primary itself
+
+USER_ID = 'analytics'
+
+
+@pytest.fixture
+def computed(app, monkeypatch):
+    analytics_cache.clear()
+    calls = []
+    url_top_stats = analytics.url_top_stats
+    monkeypatch.setattr(analytics, 'url_top_stats', lambda user_id: calls.append(user_id) or url_top_stats(user_id))
+    return calls
+
+
+def read(app, replica=False, wrote=False):
+    headers = { 'Cookie': f"{WROTE_COOKIE}=1" } if wrote else {}
+    with app.test_request_context(headers=headers):
+        g.read_only = True
+        g.replica = db.engine if replica else None
+        user_analytics(USER_ID)
+        db.session.remove()
+
+
+def test_replica_results_are_cached_for_the_after_write_window(app, computed):
+    read(app, replica=True)
+    read(app, replica=True)
+    assert len(computed) == 1
+
+    expires_at, _ = analytics_cache._data[USER_ID]
+    assert expires_at - time.monotonic() <= min(analytics_cache.ttl, replica_router.after_write)
+
+
+def test_clients_that_just_wrote_skip_replica_results(app, computed):
+    read(app, replica=True)
+    read(app, wrote=True)
+    assert len(computed) == 2
+
+    # What the primary returned serves everyone
+    read(app, replica=True)
+    assert len(computed) == 2
@@ -0,0 +1,101 @@
+import os
+from hashlib import md5
+import pytest
+from PIL import Image
+from api.utils import avatars
+
+
+# Flat uploads are named after the user id, which looks just like the digest
+# of a processed avatar, so they have to be told apart by what's on disk
+
+DIGEST = md5(b'processed').hexdigest()
+USER_ID = md5(b'user').hexdigest()
+
+
+@pytest.fixture
+def avatar_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, 'AVATAR_DIR', str(tmp_path))
+    avatars._legacy_files.clear()
+    return tmp_path
+
+
+def processed(avatar_dir, digest):
+    directory = avatar_dir / digest[:2] / digest[2:4] / digest
+    directory.mkdir(parents=True)
+    for size in avatars.SIZES:
+        Image.new('RGB', (size, size)).save(directory / f'{size}.webp')
+
+
+def flat(avatar_dir, name, format='PNG'):
+    Image.new('RGB', (8, 8), 'red').save(avatar_dir / name, format=format)
+
+
+def test_processed_avatars_are_digests_without_a_flat_file(avatar_dir):
+    processed(avatar_dir, DIGEST)
+    assert avatars.is_processed(DIGEST)
+    assert not avatars.is_legacy(DIGEST)
+    assert avatars.avatar_path(DIGEST, 64) == os.path.join(str(avatar_dir), DIGEST[:2], DIGEST[2:4], DIGEST, '64.webp')
+
+
+def test_flat_files_named_like_digests_are_legacy(avatar_dir):
+    flat(avatar_dir, USER_ID)
+    assert avatars.is_legacy(USER_ID)
+    assert not avatars.is_processed(USER_ID)
+    assert avatars.avatar_path(USER_ID, 64) == os.path.join(str(avatar_dir), USER_ID)
+
+
+def test_flat_files_with_extensions_are_legacy(avatar_dir):
+    flat(avatar_dir, f'{USER_ID}.jpg', 'JPEG')
+    assert avatars.is_legacy(f'{USER_ID}.jpg')
+    assert not avatars.is_processed(f'{USER_ID}.jpg')
+
+
+def test_other_names_are_neither(avatar_dir):
+    assert not avatars.is_legacy('../secret')
+    assert not avatars.is_processed('../secret')
+    assert not avatars.is_processed('ABCDEF')
+
+
+def test_processed_avatars_are_served_as_immutable_webp(avatar_dir):
+    processed(avatar_dir, DIGEST)
+    path, etag, mimetype, immutable = avatars.stored_avatar(DIGEST, 128)
+    assert path.endswith(os.path.join(DIGEST, '128.webp'))
+    assert (etag, mimetype, immutable) == (f'{DIGEST}-128', 'image/webp', True)
+
+
+def test_missing_sizes_and_digests_are_not_served(avatar_dir):
+    processed(avatar_dir, DIGEST)
+    assert avatars.stored_avatar(DIGEST, 32) is None
+    assert avatars.stored_avatar(md5(b'missing').hexdigest()) is None
+
+
+@pytest.mark.parametrize('name, format, mimetype', [
+    (USER_ID, 'PNG', 'image/png'),
+    (f'{USER_ID}.png', 'JPEG', 'image/jpeg'),
+    (f'{USER_ID}.gif', 'GIF', 'image/gif')
+])
+def test_legacy_avatars_are_served_as_the_format_they_contain(avatar_dir, name, format, mimetype):
+    flat(avatar_dir, name, format)
+    path, etag, served_as, immutable = avatars.stored_avatar(name)
+    assert path == os.path.join(str(avatar_dir), name)
+    assert (served_as, immutable) == (mimetype, False)
+    assert etag == avatars._digest_file(path)
+
+
+@pytest.mark.parametrize('name, content', [
+    (f'{USER_ID}.html', b'<script>alert(1)</script>'),
+    (f'{USER_ID}.svg', b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'),
+    (USER_ID, b'plain text')
+])
+def test_legacy_files_that_are_not_images_are_not_served(avatar_dir, name, content):
+    (avatar_dir / name).write_bytes(content)
+    assert avatars.stored_avatar(name) is None
+
+
+def test_replaced_legacy_files_are_checked_again(avatar_dir):
+    (avatar_dir / USER_ID).write_bytes(b'plain text')
+    assert avatars.stored_avatar(USER_ID) is None
+
+    flat(avatar_dir, USER_ID)
+    os.utime(avatar_dir / USER_ID, ns=(1, 1))
+    assert avatars.stored_avatar(USER_ID)[2] == 'image/png'
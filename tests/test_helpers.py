@@ -0,0 +1,42 @@
+import base64
+from datetime import datetime
+import pytest
+from api.utils.helpers import encode_cursor, decode_cursor, parse_page_size, PAGE_SIZE, MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize('created_at, id', [
+    (datetime(2022, 9, 8, 16, 40, 21, 337815), '9b1deb4d3b7d4bad9bdd2b0d7b3dcb6d'),
+    (datetime(2022, 1, 1), '0' * 32),
+    (datetime(1999, 12, 31, 23, 59, 59, 1), 'a')
+])
+def test_cursors_round_trip(created_at, id):
+    cursor = encode_cursor(created_at, id)
+    assert decode_cursor(cursor) == (created_at, id)
+
+
+def test_cursors_are_url_safe():
+    cursor = encode_cursor(datetime(2022, 9, 8, 16, 40, 21, 337815), '\xff' * 40)
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+
+def encoded(value):
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('utf-8')
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not base64!',
+    encoded('2022-09-08T16:40:21'),
+    encoded('yesterday|9b1deb4d3b7d4bad9bdd2b0d7b3dcb6d'),
+    encoded('2022-09-08T16:40:21|a|b')
+])
+def test_malformed_cursors_decode_to_none(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def test_page_sizes_are_clamped():
+    assert parse_page_size(None) == PAGE_SIZE
+    assert parse_page_size(0) == 1
+    assert parse_page_size(-5) == 1
+    assert parse_page_size(10) == 10
+    assert parse_page_size(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
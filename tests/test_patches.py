@@ -0,0 +1,95 @@
+import random
+import pytest
+from api.utils.patches import apply_patches, PatchError
+from api.utils.revisions import reverse_delta
+
+
+def test_patches_replace_ranges_of_the_original_text():
+    patches = [
+        { 'start': 0, 'end': 5, 'text': 'Howdy' },
+        { 'start': 7, 'end': 7, 'text': 'big ' },
+        { 'start': 12, 'text': '!' }
+    ]
+    assert apply_patches('Hello, world.', patches) == 'Howdy, big world!.'
+
+
+def test_no_patches_keep_the_text():
+    assert apply_patches('unchanged', []) == 'unchanged'
+
+
+def test_patches_can_empty_the_text():
+    assert apply_patches('<p>gone</p>', [{ 'start': 0, 'end': 11, 'text': '' }]) == ''
+
+
+def test_utf16_offsets_count_astral_characters_twice():
+    # 😀 is two UTF-16 code units, so "b" starts at 3 for a JavaScript editor
+    assert apply_patches('a😀b', [{ 'start': 3, 'end': 4, 'text': 'B' }], utf16=True) == 'a😀B'
+    assert apply_patches('a😀b', [{ 'start': 1, 'end': 3, 'text': '🙂' }], utf16=True) == 'a🙂b'
+    assert apply_patches('😀😀', [{ 'start': 4, 'text': '!' }], utf16=True) == '😀😀!'
+
+
+def test_utf16_offsets_match_code_points_without_astral_characters():
+    patches = [{ 'start': 2, 'end': 4, 'text': 'é' }]
+    assert apply_patches('café au lait', patches, utf16=True) == apply_patches('café au lait', patches)
+
+
+def test_utf16_offsets_may_not_split_a_surrogate_pair():
+    with pytest.raises(PatchError):
+        apply_patches('a😀b', [{ 'start': 2, 'end': 3, 'text': '' }], utf16=True)
+
+
+def test_utf16_offsets_past_the_end_are_out_of_range():
+    with pytest.raises(PatchError):
+        apply_patches('a😀b', [{ 'start': 5, 'text': 'x' }], utf16=True)
+
+
+@pytest.mark.parametrize('patches', [
+    { 'start': 0 },
+    ['not a patch'],
+    [{ 'start': '0', 'end': 1, 'text': 'x' }],
+    [{ 'start': 0, 'end': 1, 'text': 1 }],
+    [{ 'end': 1, 'text': 'x' }],
+    [{ 'start': 2, 'end': 1, 'text': 'x' }],
+    [{ 'start': -1, 'end': 1, 'text': 'x' }],
+    [{ 'start': 0, 'end': 99, 'text': 'x' }],
+    [{ 'start': 3, 'end': 5, 'text': 'x' }, { 'start': 4, 'end': 6, 'text': 'y' }],
+    [{ 'start': 4, 'end': 5, 'text': 'x' }, { 'start': 0, 'end': 1, 'text': 'y' }]
+])
+def test_invalid_patches_are_rejected(patches):
+    with pytest.raises(PatchError):
+        apply_patches('some text', patches)
+
+
+def edit(rng, text):
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.randint(0, 30))
+    replacement = rng.choice(['', 'word', '</p>\n<p>', 'Sentence. ', '😀', 'é'])
+    return text[:start] + replacement + text[end:]
+
+
+def test_reverse_delta_turns_the_new_text_back_into_the_old():
+    rng = random.Random(1)
+    text = ''.join(f"<p>Paragraph {number}. Some words here!</p>\n" for number in range(40))
+
+    for _ in range(300):
+        new_text = edit(rng, text)
+        assert apply_patches(new_text, reverse_delta(text, new_text)) == text
+        text = new_text
+
+
+def test_reverse_deltas_rebuild_every_revision():
+    rng = random.Random(2)
+    revisions = ['<p>first</p>']
+    for _ in range(50):
+        revisions.append(edit(rng, revisions[-1]))
+    deltas = [reverse_delta(old, new) for old, new in zip(revisions, revisions[1:])]
+
+    # Walking back from the latest body, as reconstruct does
+    text = revisions[-1]
+    for revision in range(len(deltas) - 1, -1, -1):
+        text = apply_patches(text, deltas[revision])
+        assert text == revisions[revision]
+
+
+def test_identical_texts_have_an_empty_delta():
+    assert reverse_delta('<p>same</p>', '<p>same</p>') == []
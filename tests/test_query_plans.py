@@ -0,0 +1,178 @@
+from hashlib import md5
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event, text
+from flask_jwt_extended import create_access_token
+from api.models import db
+from api.utils.cache import alias_cache
+from api.utils.analytics import analytics_cache
+from api.utils.acl import acl_cache
+from api.utils.identity import identity_cache
+from api.utils.stats import stats_snapshot
+
+
+# Runs the routes against a seeded database, captures the SELECTs they
+# actually send and checks the planner's choice for each of them. Tables are
+# sized so that a missing or unusable index shows up as a sequential scan.
+
+USERS = 2000
+URLS = 100000
+DOCUMENTS = 40000
+
+SEED = [
+    f"""INSERT INTO users (id, first_name, last_name, email, password, created_at)
+        SELECT md5('user' || g), 'Plan', 'User', 'user' || g || '@plans.test', '-', now()
+        FROM generate_series(1, {USERS}) g""",
+    f"""INSERT INTO urls (id, short_url, long_url, long_url_hash, is_private, created_at)
+        SELECT md5('url' || g), 'urrl.link/p' || g, 'https://plans.test/' || g,
+               encode(sha256(convert_to('https://plans.test/' || g, 'UTF8')), 'hex'), g % 3 = 0, now() - g * interval '1 minute'
+        FROM generate_series(1, {URLS}) g""",
+    f"""INSERT INTO user_urls (user_id, url_id, created_at)
+        SELECT md5('user' || (g % {USERS} + 1)), md5('url' || g), now() - g * interval '1 minute'
+        FROM generate_series(1, {URLS}) g""",
+    f"""INSERT INTO documents (id, title, user_id, html_text, plain_text, snippet, revision, acl_version, is_private, created_at)
+        SELECT md5('document' || g), 'Document ' || g, md5('user' || (g % {USERS} + 1)),
+               '\\x00'::bytea || convert_to('<p>body ' || g || '</p>', 'UTF8'), '\\x00'::bytea || convert_to('body ' || g, 'UTF8'),
+               'body ' || g, 0, 0, g % 4 = 0, now() - g * interval '1 minute'
+        FROM generate_series(1, {DOCUMENTS}) g""",
+    f"""INSERT INTO document_shared_users (user_id, document_id, permission)
+        SELECT md5('user' || ((g * 7 + 3) % {USERS} + 1)), md5('document' || g), 'view'
+        FROM generate_series(1, {DOCUMENTS}) g""",
+    f"""INSERT INTO visit_rollups_daily (url_id, bucket, count)
+        SELECT md5('url' || (g % {URLS} + 1)), current_date - g / {URLS}, 1 + g % 50
+        FROM generate_series(0, {URLS * 3 - 1}) g""",
+    f"""INSERT INTO visit_rollups_daily (document_id, bucket, count)
+        SELECT md5('document' || (g % {DOCUMENTS} + 1)), current_date - g / {DOCUMENTS}, 1 + g % 50
+        FROM generate_series(0, {DOCUMENTS * 3 - 1}) g""",
+    f"""INSERT INTO visits (id, url_id, time)
+        SELECT md5('visit' || g), md5('url' || (g % {URLS} + 1)), now() - g * interval '1 second'
+        FROM generate_series(1, {URLS}) g"""
+]
+
+LARGE_TABLES = {'users', 'urls', 'user_urls', 'documents', 'document_shared_users', 'visit_rollups_daily', 'visits'}
+
+# Owns every url and document numbered a multiple of 2000
+USER_ID = md5(b'user1').hexdigest()
+DOCUMENT_ID = md5(b'document2000').hexdigest()
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    with app.app_context():
+        for statement in SEED:
+            db.session.execute(text(statement))
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+        db.session.close()
+    return app
+
+
+@pytest.fixture
+def client(seeded):
+    for cache in (alias_cache, analytics_cache, acl_cache, identity_cache):
+        cache.clear()
+
+    client = seeded.test_client()
+    with seeded.app_context():
+        client.set_cookie('localhost', 'access_token_cookie', create_access_token(identity=USER_ID))
+    return client
+
+
+@contextmanager
+def captured(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def explain(app, statements):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            return [connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]['Plan']
+                    for statement, parameters in statements]
+
+
+def nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from nodes(child)
+
+
+def indexes(plans):
+    return {node['Index Name'] for plan in plans for node in nodes(plan) if 'Index Name' in node}
+
+
+def assert_no_large_scans(statements, plans):
+    for (statement, _), plan in zip(statements, plans):
+        scanned = {node['Relation Name'] for node in nodes(plan) if node['Node Type'] == 'Seq Scan'} & LARGE_TABLES
+        assert not scanned, f"sequential scan of {', '.join(sorted(scanned))} in\n{statement}"
+
+
+def test_url_listing_walks_the_owner_index(seeded, client):
+    with captured(seeded) as statements:
+        first = client.get('/api/v1/user/urls?limit=10')
+        assert first.status_code == 200 and first.json['next_cursor']
+        assert client.get(f"/api/v1/user/urls?limit=10&cursor={first.json['next_cursor']}").status_code == 200
+
+    plans = explain(seeded, statements)
+    assert_no_large_scans(statements, plans)
+    assert 'ix_user_urls_user_id_created_at_url_id' in indexes(plans)
+
+
+def test_document_listing_walks_the_owner_index(seeded, client):
+    with captured(seeded) as statements:
+        first = client.get('/api/v1/user/documents?limit=5')
+        assert first.status_code == 200 and first.json['next_cursor']
+        assert client.get(f"/api/v1/user/documents?limit=5&cursor={first.json['next_cursor']}").status_code == 200
+
+    plans = explain(seeded, statements)
+    assert_no_large_scans(statements, plans)
+    assert 'ix_documents_user_id_created_at_id' in indexes(plans)
+
+
+def test_user_stats_read_rollups_by_owner(seeded, client):
+    with captured(seeded) as statements:
+        assert client.get('/api/v1/user/stats').status_code == 200
+
+    plans = explain(seeded, statements)
+    assert_no_large_scans(statements, plans)
+    assert {'uq_visit_rollups_daily_url', 'uq_visit_rollups_daily_document'} <= indexes(plans)
+
+
+def test_visit_and_dedup_use_their_indexes(seeded, client):
+    with captured(seeded) as statements:
+        # url 2 is public (2 % 3 != 0)
+        assert client.get('/api/v1/url/visit/?alias=p2').status_code == 200
+        assert client.post('/api/v1/url/private/create', json={ 'long_url': 'https://plans.test/2' }).status_code in (200, 201)
+
+    plans = explain(seeded, statements)
+    assert_no_large_scans(statements, plans)
+    assert 'ix_urls_long_url_hash_public' in indexes(plans)
+
+
+def test_document_read_uses_keys(seeded, client):
+    with captured(seeded) as statements:
+        assert client.get(f"/api/v1/document/id/{DOCUMENT_ID}").status_code == 200
+
+    assert_no_large_scans(statements, explain(seeded, statements))
+
+
+def test_global_stats_read_only_rollups(seeded):
+    with captured(seeded) as statements:
+        stats_snapshot.init_app(seeded)
+        stats_snapshot.load()
+
+    relations = {node.get('Relation Name') for plan in explain(seeded, statements) for node in nodes(plan)}
+    assert 'visit_rollups_daily' in relations
+    assert 'visits' not in relations
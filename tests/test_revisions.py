@@ -0,0 +1,102 @@
+import random
+from hashlib import md5
+import pytest
+from sqlalchemy import text
+from flask_jwt_extended import create_access_token
+from api.models import db, User
+from api.utils import revisions
+
+
+# Edits a document through the routes and reads every revision back, with
+# snapshots every few revisions so the walk crosses them
+
+USER_ID = md5(b'revisions').hexdigest()
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    monkeypatch.setattr(revisions, 'SNAPSHOT_INTERVAL', 4)
+
+    with app.app_context():
+        if User.query.get(USER_ID) is None:
+            db.session.add(User(id=USER_ID, first_name='Rev', last_name='Isions', email='revisions@example.com', password='-'))
+            db.session.commit()
+        db.session.close()
+
+    client = app.test_client()
+    with app.app_context():
+        client.set_cookie('localhost', 'access_token_cookie', create_access_token(identity=USER_ID))
+    return client
+
+
+def body(number, rng):
+    words = ' '.join(rng.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet', '😀']) for _ in range(20))
+    return f"<p>Revision {number}.</p>\n<p>{words}</p>", f"Revision {number}. {words}"
+
+
+def edited_document(client, edits):
+    rng = random.Random(len(edits))
+    html_text, plain_text = body(0, rng)
+    response = client.post('/api/v1/document/create', json={ 'title': 'History', 'html_text': html_text, 'plain_text': plain_text })
+    document_id = response.json['id']
+
+    bodies = { 0: (html_text, plain_text) }
+    for number, fields in enumerate(edits, start=1):
+        if fields == 'body':
+            html_text, plain_text = body(number, rng)
+            fields = { 'html_text': html_text, 'plain_text': plain_text }
+        response = client.patch('/api/v1/document/edit', json={ 'id': document_id, **fields })
+        assert response.status_code == 201
+        bodies[response.json['revision']] = (html_text, plain_text)
+
+    return document_id, bodies
+
+
+def read(client, document_id, revision):
+    return client.get(f"/api/v1/document/id/{document_id}/revisions/{revision}")
+
+
+def test_every_revision_is_rebuilt(client):
+    document_id, bodies = edited_document(client, ['body'] * 10)
+    assert sorted(bodies) == list(range(11))
+
+    for revision, (html_text, plain_text) in bodies.items():
+        response = read(client, document_id, revision)
+        assert response.status_code == 200
+        assert (response.json['html_text'], response.json['plain_text']) == (html_text, plain_text)
+
+
+def test_title_and_privacy_edits_keep_the_bodies(client):
+    document_id, bodies = edited_document(client, ['body', { 'title': 'Renamed' }, { 'is_private': True }, 'body'])
+
+    assert sorted(bodies) == [0, 1, 2, 3, 4]
+    assert bodies[2] == bodies[3] == bodies[1]
+    for revision, (html_text, _) in bodies.items():
+        assert read(client, document_id, revision).json['html_text'] == html_text
+
+
+def test_unchanged_edits_keep_the_revision(client):
+    document_id, bodies = edited_document(client, ['body', { 'title': 'History' }])
+    assert sorted(bodies) == [0, 1]
+
+
+def test_a_gap_in_the_history_is_not_served_as_the_current_body(app, client):
+    document_id, bodies = edited_document(client, ['body'] * 3)
+
+    # Revision 2 lost its delta, so it and everything before it down to the
+    # previous snapshot can't be rebuilt
+    with app.app_context():
+        db.session.execute(text(
+            'UPDATE document_revisions SET html_text = NULL, plain_text = NULL WHERE document_id = :id AND revision = 2'
+        ), { 'id': document_id })
+        db.session.commit()
+
+    assert read(client, document_id, 3).json['html_text'] == bodies[3][0]
+    assert read(client, document_id, 2).status_code == 404
+    assert read(client, document_id, 1).status_code == 404
+    assert read(client, document_id, 0).json['html_text'] == bodies[0][0]
+
+
+def test_unknown_revisions_are_not_found(client):
+    document_id, _ = edited_document(client, ['body'])
+    assert read(client, document_id, 7).status_code == 404
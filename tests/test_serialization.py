@@ -0,0 +1,106 @@
+import json
+import uuid
+from decimal import Decimal
+from datetime import date, datetime
+import pytest
+from flask import Flask
+from flask.json import jsonify as flask_jsonify
+from api.utils.serialization import JSONProvider
+
+
+pytest.importorskip('orjson')
+
+
+PAYLOADS = {
+    'document': {
+        'id': '9b1deb4d3b7d4bad9bdd2b0d7b3dcb6d',
+        'title': 'Ünïcödé títle 😀',
+        'html_text': '<p>Some "quoted" text</p>\n<p>  and \\ backslashes</p>',
+        'users_sharing': ['a@example.com', 'b@example.com'],
+        'private': False,
+        'revision': 42
+    },
+    'listing': {
+        'urls': [{ 'id': str(number), 'private': number % 2 == 0 } for number in range(100)],
+        'next_cursor': None,
+        'top_stats': [{ 'x': 'urrl.link/a', 'y': Decimal('12'), 'text': '100.0%' }]
+    },
+    'stats': {
+        'line': [[{ 'x': (2022, 9, 1), 'y': 3 }], [{ 'x': [2022, 9], 'y': 0 }]],
+        'generated_at': datetime(2022, 9, 14, 10, 41, 53, 274180),
+        'day': date(2022, 9, 14)
+    },
+    'values': {
+        'float': 0.1,
+        'negative': -7,
+        'uuid': uuid.UUID('9b1deb4d-3b7d-4bad-9bdd-2b0d7b3dcb6d'),
+        'nested': { 'b': [1, { 'a': None }], 'a': True }
+    }
+}
+
+
+@pytest.fixture
+def json_app():
+    app = Flask(__name__)
+    app.config['JSON_ENCODER'] = 'orjson'
+    return app
+
+
+@pytest.fixture
+def provider(json_app):
+    provider = JSONProvider()
+    provider.init_app(json_app)
+    assert provider.encoder == 'orjson'
+    return provider
+
+
+@pytest.mark.parametrize('name', PAYLOADS)
+def test_orjson_writes_the_same_documents_as_flask(json_app, provider, name):
+    with json_app.app_context():
+        expected = flask_jsonify(PAYLOADS[name])
+        response = provider.response(PAYLOADS[name])
+
+    assert json.loads(response.get_data()) == json.loads(expected.get_data())
+    assert response.mimetype == expected.mimetype == 'application/json'
+
+
+def test_orjson_writes_dates_as_http_dates(json_app, provider):
+    with json_app.app_context():
+        body = json.loads(provider.response(PAYLOADS['stats']).get_data())
+    assert body['generated_at'] == 'Wed, 14 Sep 2022 10:41:53 GMT'
+    assert body['day'] == 'Wed, 14 Sep 2022 00:00:00 GMT'
+
+
+def test_orjson_sorts_keys_like_flask(json_app, provider):
+    json_app.config['JSON_SORT_KEYS'] = True
+    with json_app.app_context():
+        assert provider.response(PAYLOADS['values']).get_data().startswith(b'{"float"')
+        assert provider.response({ 'b': 1, 'a': 2 }).get_data() == b'{"a":2,"b":1}\n'
+
+
+def test_positional_and_keyword_arguments(json_app, provider):
+    with json_app.app_context():
+        assert json.loads(provider.response(1, 2).get_data()) == [1, 2]
+        assert json.loads(provider.response(a=1).get_data()) == { 'a': 1 }
+        with pytest.raises(TypeError):
+            provider.response(1, a=1)
+
+
+def test_values_orjson_cannot_encode_fall_back_to_flask(json_app, provider):
+    payload = { 'big': 2 ** 70 }
+    with json_app.app_context():
+        assert provider.response(payload).get_data() == flask_jsonify(payload).get_data()
+
+
+def test_the_stdlib_encoder_is_flask_itself(json_app):
+    json_app.config['JSON_ENCODER'] = 'stdlib'
+    provider = JSONProvider()
+    provider.init_app(json_app)
+    with json_app.app_context():
+        assert provider.response(PAYLOADS['document']).get_data() == flask_jsonify(PAYLOADS['document']).get_data()
+
+
+def test_unknown_encoders_are_rejected(json_app):
+    json_app.config['JSON_ENCODER'] = 'simplejson'
+    with pytest.raises(ValueError):
+        JSONProvider().init_app(json_app)
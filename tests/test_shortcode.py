@@ -0,0 +1,31 @@
+from api.utils.shortcode import encode, ALPHABET, CODE_LENGTH, KEYSPACE
+
+
+def test_codes_are_fixed_length_base62():
+    for number in (0, 1, 61, 62, KEYSPACE // 2, KEYSPACE - 1):
+        code = encode(number)
+        assert len(code) == CODE_LENGTH
+        assert set(code) <= set(ALPHABET)
+
+
+def test_consecutive_numbers_get_distinct_codes():
+    codes = {encode(number) for number in range(200000)}
+    assert len(codes) == 200000
+
+
+def test_numbers_across_the_keyspace_get_distinct_codes():
+    step = KEYSPACE // 100003
+    codes = {encode(number) for number in range(0, KEYSPACE, step)}
+    assert len(codes) == len(range(0, KEYSPACE, step))
+
+
+def test_codes_are_stable():
+    # Issued codes are stored as short urls, so the mapping must never change
+    assert [encode(number) for number in (0, 1, 2, KEYSPACE - 1)] == ['zNQbLuP', '2CxFY1Z', 'vqd9ax7', '6Z9GxWF']
+    assert encode(KEYSPACE) == encode(0)
+
+
+def test_neighbouring_numbers_look_unrelated():
+    for number in range(10000):
+        first, second = encode(number), encode(number + 1)
+        assert all(a != b for a, b in zip(first, second))
@@ -0,0 +1,85 @@
+from hashlib import md5
+import pytest
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from api.models import db, User, Url, Document, Visit, DailyVisitRollup
+from api.utils import visits
+from api.utils.visits import visit_recorder
+
+
+# Flushes batches the way the background thread does, with a visit whose
+# document was deleted while it sat in the queue
+
+USER_ID = md5(b'visits').hexdigest()
+
+
+@pytest.fixture
+def targets(app):
+    with app.app_context():
+        if User.query.get(USER_ID) is None:
+            db.session.add(User(id=USER_ID, first_name='Vis', last_name='Its', email='visits@example.com', password='-'))
+        url = Url(short_url=f"urrl.link/{md5(str(Url.query.count()).encode()).hexdigest()[:10]}", long_url='https://visits.example.com/')
+        kept = Document(title='Kept', user_id=USER_ID, html_text='<p>kept</p>', plain_text='kept')
+        deleted = Document(title='Deleted', user_id=USER_ID, html_text='<p>deleted</p>', plain_text='deleted')
+        db.session.add_all([url, kept, deleted])
+        db.session.commit()
+        ids = url.id, kept.id, deleted.id
+
+        db.session.delete(deleted)
+        db.session.commit()
+        db.session.close()
+    return ids
+
+
+def batch(targets):
+    url_id, kept_id, deleted_id = targets
+    rows = [visit_recorder._row(url_id, None) for _ in range(3)]
+    rows += [visit_recorder._row(None, kept_id) for _ in range(2)]
+    rows.insert(2, visit_recorder._row(None, deleted_id))
+    return rows
+
+
+def stored(app, targets):
+    url_id, kept_id, _ = targets
+    with app.app_context():
+        counts = []
+        for column, target_id in ((Visit.url_id, url_id), (Visit.document_id, kept_id)):
+            counts.append(db.session.query(func.count()).filter(column == target_id).scalar())
+        for column, target_id in ((DailyVisitRollup.url_id, url_id), (DailyVisitRollup.document_id, kept_id)):
+            counts.append(db.session.query(func.coalesce(func.sum(DailyVisitRollup.count), 0)).filter(column == target_id).scalar())
+        db.session.close()
+    return counts
+
+
+def test_visits_of_deleted_documents_are_left_out(app, targets):
+    visit_recorder._flush(batch(targets))
+    assert stored(app, targets) == [3, 2, 3, 2]
+
+
+def test_a_deletion_after_the_check_only_drops_its_own_visit(app, targets, monkeypatch):
+    monkeypatch.setattr(visit_recorder, '_existing', lambda rows: rows)
+    visit_recorder._flush(batch(targets))
+    assert stored(app, targets) == [3, 2, 3, 2]
+
+
+def test_a_batch_is_retried_when_the_database_is_unreachable(app, targets, monkeypatch):
+    monkeypatch.setattr(visits, 'FLUSH_RETRY_DELAY', 0)
+    write = visit_recorder._write
+    failures = iter([OperationalError('INSERT', {}, Exception('connection lost'))])
+
+    def flaky(rows):
+        failure = next(failures, None)
+        if failure:
+            raise failure
+        return write(rows)
+
+    monkeypatch.setattr(visit_recorder, '_write', flaky)
+    visit_recorder._flush(batch(targets))
+    assert stored(app, targets) == [3, 2, 3, 2]
+
+
+def test_a_batch_already_stored_is_not_counted_twice(app, targets):
+    rows = batch(targets)
+    visit_recorder._flush(rows)
+    visit_recorder._flush(rows)
+    assert stored(app, targets) == [3, 2, 3, 2]